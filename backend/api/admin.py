@@ -2,10 +2,27 @@ from django import forms
 from django.contrib import admin
 from django.db.models import TextField, CharField
 
+from api.cache import bump_data_version_on_commit
 from api.models import ShipCategory, Ship, ShipModelLOD, Texture, TexturePack
 
 
-class ShipCategoryAdmin(admin.ModelAdmin):
+class DataVersionAdmin(admin.ModelAdmin):
+    """ invalidates cached API responses, every admin add, change and delete is logged through these """
+
+    def log_addition(self, *args, **kwargs):
+        bump_data_version_on_commit()
+        return super(DataVersionAdmin, self).log_addition(*args, **kwargs)
+
+    def log_change(self, *args, **kwargs):
+        bump_data_version_on_commit()
+        return super(DataVersionAdmin, self).log_change(*args, **kwargs)
+
+    def log_deletion(self, *args, **kwargs):
+        bump_data_version_on_commit()
+        return super(DataVersionAdmin, self).log_deletion(*args, **kwargs)
+
+
+class ShipCategoryAdmin(DataVersionAdmin):
     model = ShipCategory
 
     fields = ('name', 'description', 'parent_category', 'background_image', 'logo' )
@@ -23,13 +40,13 @@ class ShipAdminForm(forms.ModelForm):
         fields = '__all__'
 
 
-class ShipAdmin(admin.ModelAdmin):
+class ShipAdmin(DataVersionAdmin):
     form = ShipAdminForm
     list_display = ('name', 'category', 'price', 'mass', 'get_lods')
     search_fields = ('name', 'category__name', )
 
 
-class ShipModelLODAdmin(admin.ModelAdmin):
+class ShipModelLODAdmin(DataVersionAdmin):
     model = ShipModelLOD
 
     fields = ('ship', 'lod_name', )
@@ -38,7 +55,7 @@ class ShipModelLODAdmin(admin.ModelAdmin):
     list_display = ('ship', 'lod_name', )
 
 
-class TexturePackAdmin(admin.ModelAdmin):
+class TexturePackAdmin(DataVersionAdmin):
     model = TexturePack
 
     fields = ('pack_id', )
@@ -47,7 +64,7 @@ class TexturePackAdmin(admin.ModelAdmin):
     list_display = ('pack_id', )
 
 
-class TextureAdmin(admin.ModelAdmin):
+class TextureAdmin(DataVersionAdmin):
     model = Texture
 
     fields = ('tex_id', )
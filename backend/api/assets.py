@@ -0,0 +1,184 @@
+import os
+import gzip
+import struct
+import hashlib
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COPY_CHUNK_SIZE = 1024 * 1024
+SIDECAR_SUFFIXES = ('.gz', '.br')
+
+
+class Asset(object):
+    """ a static file assembled from one or more zip members, stored under its content hash """
+
+    def __init__(self, target_pattern, members, with_header=False):
+        # e.g. 'static/models/{}.dat', filled in with the content hash
+        self.target_pattern = target_pattern
+        self.target = None
+        self.members = members
+
+        # model files start with the uint32 byte length of every member
+        self.with_header = with_header
+
+        # filled in while writing
+        self.content_hash = None
+
+
+class AssetWriter(object):
+    """
+    extracts assets from an import zip with a pool of threads.
+
+    every thread reads through its own ZipFile handle, copies the members
+    in chunks to a temporary file and renames it to its content hash, so
+    readers never see a half written asset and identical files are stored
+    once. a target that already exists has the same content and is left
+    untouched. with compress, .gz and (if brotli is installed) .br sidecars
+    are written next to every asset, so they can be served without
+    compressing on every request.
+    """
+
+    def __init__(self, zip_path, workers=4, compress=False):
+        self.zip_path = zip_path
+        self.workers = max(1, workers)
+        self.compress = compress
+
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def write_all(self, assets):
+        """ returns a list of flags, False for every asset that already existed """
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # list() re-raises the first error of a worker
+                return list(pool.map(self._write, assets))
+        finally:
+            for handle in self._handles:
+                handle.close()
+            self._handles = []
+
+    def _get_zip(self):
+        zf = getattr(self._local, 'zf', None)
+        if zf is None:
+            zf = ZipFile(self.zip_path, 'r')
+            self._local.zf = zf
+            with self._lock:
+                self._handles.append(zf)
+        return zf
+
+    def _write(self, asset):
+        zf = self._get_zip()
+        tmp_path = '{}.{}.tmp'.format(asset.target_pattern.format('new'), threading.get_ident())
+        digest = hashlib.sha1()
+
+        try:
+            with open(tmp_path, 'wb') as handle:
+                handle.writelines(self._iter_chunks(zf, asset, digest))
+        except Exception:
+            # garbage collection skips temporary files, so a failed write cleans up itself
+            _remove_files([tmp_path])
+            raise
+        asset.content_hash = digest.hexdigest()
+        asset.target = asset.target_pattern.format(asset.content_hash)
+
+        if os.path.isfile(asset.target):
+            os.remove(tmp_path)
+
+            if self.compress and not all(os.path.isfile(path) for path in get_sidecar_paths(asset.target).values()):
+                write_sidecars(asset.target)
+            return False
+
+        os.replace(tmp_path, asset.target)
+        if self.compress:
+            write_sidecars(asset.target)
+        return True
+
+    @staticmethod
+    def _iter_chunks(zf, asset, digest):
+        if asset.with_header:
+            header = b''.join(struct.pack('I', zf.getinfo(member).file_size) for member in asset.members)
+            digest.update(header)
+            yield header
+
+        for member in asset.members:
+            with zf.open(member) as source:
+                for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    yield chunk
+
+
+def collect_garbage(used_paths, directories):
+    """ removes assets and their sidecars that are not in used_paths, returns the number of removed files """
+    removed = 0
+
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            # temporary files belong to writers that are still running
+            if name.startswith('.') or name.endswith('.tmp'):
+                continue
+
+            asset_path = path[:path.rindex('.')] if name.endswith(SIDECAR_SUFFIXES) else path
+            if asset_path not in used_paths:
+                os.remove(path)
+                removed += 1
+
+    return removed
+
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def get_sidecar_paths(path):
+    """ precompressed variants of path, by content coding """
+    paths = {'gzip': path + '.gz'}
+    if brotli is not None:
+        paths['br'] = path + '.br'
+    return paths
+
+
+def write_sidecars(path):
+    sidecar_paths = get_sidecar_paths(path)
+    tmp_suffix = '.{}.tmp'.format(threading.get_ident())
+
+    # no name and mtime in the header, equal files get equal sidecars
+    gzip_target = open(sidecar_paths['gzip'] + tmp_suffix, 'wb')
+    gzip_file = gzip.GzipFile('', 'wb', 9, gzip_target, mtime=0)
+    brotli_file = None
+    if brotli is not None:
+        # quality 11 is several times slower for a few percent
+        compressor = brotli.Compressor(quality=9)
+        brotli_file = open(sidecar_paths['br'] + tmp_suffix, 'wb')
+
+    try:
+        with open(path, 'rb') as source, gzip_target, gzip_file:
+            for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+                gzip_file.write(chunk)
+                if brotli_file:
+                    brotli_file.write(compressor.process(chunk))
+
+        if brotli_file:
+            with brotli_file:
+                brotli_file.write(compressor.finish())
+    except Exception:
+        if brotli_file:
+            brotli_file.close()
+        _remove_files([sidecar_path + tmp_suffix for sidecar_path in sidecar_paths.values()])
+        raise
+
+    for sidecar_path in sidecar_paths.values():
+        os.replace(sidecar_path + tmp_suffix, sidecar_path)
@@ -0,0 +1,100 @@
+"""
+response cache for the read-only JSON API.
+
+all responses are cached under a global data version, which lives in a
+small file so every worker process sees a bump at once. import_ships and
+admin edits bump it, which makes all older entries unreachable.
+
+settings (all optional):
+    API_CACHE_ALIAS         entry of CACHES to use, 'default' is a local memory cache
+                            unless local.py configures something else, e.g. a
+                            FileBasedCache shared by all workers
+    API_CACHE_TIMEOUT       seconds an entry is kept, None keeps it until it is culled
+    API_DATA_VERSION_FILE   file holding the data version
+"""
+import os
+import uuid
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponseNotModified
+
+
+def _get_version_file():
+    return getattr(settings, 'API_DATA_VERSION_FILE', os.path.join(settings.BASE_DIR, '.data_version'))
+
+
+def get_data_version():
+    try:
+        with open(_get_version_file(), 'r') as file:
+            return file.read().strip() or '0'
+    except FileNotFoundError:
+        return '0'
+
+
+def bump_data_version():
+    version_file = _get_version_file()
+    tmp_path = '{}.{}.tmp'.format(version_file, os.getpid())
+
+    with open(tmp_path, 'w') as file:
+        file.write(uuid.uuid4().hex)
+    os.replace(tmp_path, version_file)
+
+
+def bump_data_version_on_commit():
+    # bumping before the commit would let a request cache the old rows under the new version
+    transaction.on_commit(bump_data_version)
+
+
+def get_etag(version, path):
+    # responses only change with the data version, so version and path identify the content
+    return '"{}"'.format(hashlib.sha1('{}:{}'.format(version, path).encode('utf-8')).hexdigest())
+
+
+def _get_candidates(if_none_match):
+    return [candidate.strip() for candidate in if_none_match.split(',')]
+
+
+def _etag_matches(candidates, etag):
+    return etag in candidates or 'W/' + etag in candidates
+
+
+class CachedResponseMixin(object):
+    """ caches successful GET responses per data version and answers conditional requests without the DB """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+
+        path = request.get_full_path()
+        version = get_data_version()
+        etag = get_etag(version, path)
+
+        candidates = _get_candidates(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if _etag_matches(candidates, etag):
+            return self._get_not_modified(etag)
+
+        cache = caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+        key = 'api:{}:{}'.format(version, hashlib.sha1(path.encode('utf-8')).hexdigest())
+
+        response = cache.get(key)
+        if response is None:
+            response = super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            response['ETag'] = etag
+            cache.set(key, response, getattr(settings, 'API_CACHE_TIMEOUT', None))
+
+        # '*' matches any current representation, so only once the resource is known to exist
+        if '*' in candidates:
+            return self._get_not_modified(etag)
+        return response
+
+    @staticmethod
+    def _get_not_modified(etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+class Command(BaseCommand):
+    help = 'measures query count and latency of API views, e.g. bench_api /api/ships/1'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            type=str,
+            help='request paths to measure',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='requests per path',
+        )
+
+    def handle(self, **options):
+        factory = RequestFactory()
+
+        for path in options.get('paths'):
+            match = resolve(path.split('?')[0])
+            timings = []
+            queries = 0
+
+            for _ in range(options.get('requests')):
+                request = factory.get(path)
+
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = match.func(request, *match.args, **match.kwargs)
+                    timings.append(time.perf_counter() - start)
+                queries = len(context.captured_queries)
+
+            timings.sort()
+            self.stdout.write('{}: status {}, {} bytes, {} queries, p50 {:.2f}ms, p95 {:.2f}ms'.format(
+                path,
+                response.status_code,
+                len(response.content),
+                queries,
+                timings[len(timings) // 2] * 1000,
+                timings[int(len(timings) * 0.95)] * 1000,
+            ))
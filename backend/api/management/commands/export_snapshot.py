@@ -0,0 +1,89 @@
+import os
+import io
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve
+
+from api.models import Ship, ShipCategory
+
+
+class Command(BaseCommand):
+    help = 'renders every API response to static files, /api/<path> is stored as <output>/<path>.json(.gz)'
+
+    SNAPSHOT_SUFFIXES = ('.json', '.json.gz')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='static/api',
+            help='snapshot directory',
+        )
+
+    def handle(self, **options):
+        output = options.get('output')
+        factory = RequestFactory()
+
+        written = set()
+        changed = 0
+        for path in self._get_paths():
+            # the views themselves render the content, so the files match the API byte for byte
+            match = resolve(path)
+            response = match.func(factory.get(path), *match.args, **match.kwargs)
+            if response.status_code != 200:
+                raise CommandError('{} returned {}'.format(path, response.status_code))
+
+            filename = os.path.join(output, *path[len('/api/'):].split('/')) + '.json'
+            for target, content in [(filename, response.content), (filename + '.gz', self._compress(response.content))]:
+                written.add(target)
+                changed += self._write(target, content)
+
+        removed = 0
+        for directory, _, files in os.walk(output):
+            for name in files:
+                path = os.path.join(directory, name)
+                # only stale snapshot files go, the output may be shared with other static files
+                if name.endswith(self.SNAPSHOT_SUFFIXES) and path not in written:
+                    os.remove(path)
+                    removed += 1
+
+        self.stdout.write('{} snapshot files written, {} unchanged, {} removed'.format(
+            changed, len(written) - changed, removed,
+        ))
+
+    @staticmethod
+    def _get_paths():
+        yield '/api/categories'
+        yield '/api/categories/0'
+
+        for category_id in ShipCategory.objects.values_list('id', flat=True).order_by('id'):
+            yield '/api/categories/{}'.format(category_id)
+            yield '/api/categories/{}/ships'.format(category_id)
+
+        for ship_id in Ship.objects.values_list('id', flat=True).order_by('id'):
+            yield '/api/ships/{}'.format(ship_id)
+
+    @staticmethod
+    def _compress(content):
+        # mtime 0 keeps the archive stable for unchanged content
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as file:
+            file.write(content)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _write(path, content):
+        """ replaces path atomically, returns False if it already had this content """
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                if file.read() == content:
+                    return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+        return True
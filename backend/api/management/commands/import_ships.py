@@ -1,11 +1,15 @@
 import json
-import struct
 import math
+import time
 
-from django.core.management.base import BaseCommand
+from contextlib import contextmanager
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from zipfile import ZipFile
 
+from api.assets import Asset, AssetWriter, collect_garbage
+from api.cache import bump_data_version
 from api.models import Ship, ShipModelLOD, Texture, TexturePack
 
 class Command(BaseCommand):
@@ -24,13 +28,24 @@ class Command(BaseCommand):
         'linear_drag': 'linear_drag',
         'nudge_force': 'nudge', 
         'mass': 'mass', 
+        'nickname': 'nickname',
     }
 
+    MODEL_DIR = 'static/models'
+    TEXTURE_DIR = 'static/textures'
+
     TRIPLET_FIELDS = {
         'steering_torque': 'torgue',
         'angular_drag': 'drag',
         'rotation_inertia': 'inertia',
     }
+
+    TEXTURE_FIELDS = [
+        'content_hash', 'format', 'variant_hashes',
+        'has_light', 'light_hash',
+        'has_bump', 'bump_hash',
+        'has_meta', 'meta_hash',
+    ]
     
     def add_arguments(self, parser):
         parser.add_argument(
@@ -45,31 +60,269 @@ class Command(BaseCommand):
             default=False,
             help='delete all old ships',
         )  
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            default=False,
+            help='match ships by nickname, only write what changed',
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            default=False,
+            help='insert rows with bulk_create instead of one query per row',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='rows per INSERT in bulk mode',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='threads extracting model and texture files',
+        )
+        parser.add_argument(
+            '--no-compress',
+            action='store_true',
+            default=False,
+            help='do not write .gz/.br sidecars next to the model and texture files',
+        )
+        parser.add_argument(
+            '--snapshot',
+            action='store_true',
+            default=False,
+            help='run export_snapshot after the import',
+        )
 
-    @transaction.atomic
     def handle(self, **options):
         filename = options.get('file')
         flush = options.get('flush', False)
+        update = options.get('update', False)
 
-        if flush:
-            Ship.objects.all().delete()
-            TexturePack.objects.all().delete()
-            
+        if flush and update:
+            raise CommandError('--flush and --update can not be combined')
 
         with ZipFile(filename, 'r') as zf:
-            ship_data = json.loads(zf.read('data.json').decode('utf-8'))
-            pack_by_pack_id = self._import_textures(zf, ship_data['texture_ids'])
-            self._import_ships(zf, ship_data['ships'], pack_by_pack_id)
+            with self._phase('read data.json'):
+                ship_data = json.loads(zf.read('data.json').decode('utf-8'))
+
+            # files are named by their content hash, writing them first never touches what the old rows use
+            with self._phase('files extracted'):
+                assets = self._get_assets(zf, ship_data)
+                writer = AssetWriter(filename, options.get('workers'), compress=not options.get('no_compress', False))
+                written = sum(writer.write_all(list(assets.values())))
+            self.stdout.write('{} files written, {} already present'.format(written, len(assets) - written))
+
+        hashes = {member: asset.content_hash for member, asset in assets.items()}
+        with transaction.atomic():
+            if flush:
+                with self._phase('flush'):
+                    Ship.objects.all().delete()
+                    TexturePack.objects.all().delete()
+
+            if update:
+                self._update_import(ship_data, hashes)
+            elif options.get('bulk', False):
+                self._bulk_import(ship_data, hashes, options.get('batch_size'))
+            else:
+                with self._phase('textures'):
+                    pack_by_pack_id = self._import_textures(ship_data['texture_ids'], ship_data, hashes)
+                with self._phase('ships'):
+                    self._import_ships(ship_data['ships'], pack_by_pack_id, hashes)
+
+        # rows and files are in place, cached API responses are outdated now
+        bump_data_version()
+
+        if options.get('snapshot', False):
+            with self._phase('snapshot'):
+                call_command('export_snapshot', stdout=self.stdout)
+
+        # only after nothing served points at the old files anymore
+        with self._phase('unused files removed'):
+            removed = collect_garbage(self._get_used_files(), [self.MODEL_DIR, self.TEXTURE_DIR])
+        self.stdout.write('{} unused files removed'.format(removed))
+
+    @contextmanager
+    def _phase(self, name):
+        start = time.time()
+        yield
+        self.stdout.write('[{:.3f}s] {}'.format(time.time() - start, name))
+
+    @staticmethod
+    def _bulk_create(model, objects, batch_size):
+        """ bulk_create that also sets the primary keys on backends that do not return them """
+        last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        model.objects.bulk_create(objects, batch_size=batch_size)
+
+        if objects and objects[0].pk is None:
+            pks = model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)
+            for obj, pk in zip(objects, pks):
+                obj.pk = pk
+
+    def _bulk_import(self, ship_data, hashes, batch_size):
+        with self._phase('texture packs'):
+            packs = [
+                TexturePack(pack_id=int(pack_id), source=self._get_source(ship_data, pack_id))
+                for pack_id in ship_data['texture_ids']
+            ]
+            self._bulk_create(TexturePack, packs, batch_size)
+            pack_by_pack_id = {pack.pack_id: pack for pack in packs}
+
+        with self._phase('textures'):
+            textures = []
+            for pack_id, tex_ids in ship_data['texture_ids'].items():
+                textures += self._get_textures(pack_by_pack_id[int(pack_id)], pack_id, tex_ids, ship_data, hashes)
+            Texture.objects.bulk_create(textures, batch_size=batch_size)
+
+        with self._phase('ships'):
+            import_ids = list(ship_data['ships'])
+            ships = [Ship(**self._get_ship_fields(ship_data['ships'][import_id])) for import_id in import_ids]
+            self._bulk_create(Ship, ships, batch_size)
+
+        with self._phase('texture links'):
+            through = Ship.textures.through
+            links = [
+                through(ship_id=ship.pk, texturepack_id=pack_by_pack_id[pack_id].pk)
+                for import_id, ship in zip(import_ids, ships)
+                for pack_id in ship_data['ships'][import_id]['texture_pack_ids']
+            ]
+            through.objects.bulk_create(links, batch_size=batch_size)
+
+        with self._phase('models'):
+            lods = []
+            for import_id, ship in zip(import_ids, ships):
+                for lod_name in ship_data['ships'][import_id]['model_data']['lods']:
+                    lods.append(self._get_model(ship, lod_name, import_id, hashes))
+            ShipModelLOD.objects.bulk_create(lods, batch_size=batch_size)
+
+    def _update_import(self, ship_data, hashes):
+        if 'texture_sources' not in ship_data:
+            raise CommandError('package has no texture sources, repackage it or import with --flush')
+
+        with self._phase('texture packs'):
+            pack_by_pack_id = self._update_texture_packs(ship_data, hashes)
+        with self._phase('ships'):
+            self._update_ships(ship_data['ships'], pack_by_pack_id, hashes)
+
+        with self._phase('cleanup'):
+            sources = set(ship_data['texture_sources'].values())
+            TexturePack.objects.exclude(source__in=sources).filter(ship__isnull=True).delete()
+
+    def _update_texture_packs(self, ship_data, hashes):
+        existing = {
+            pack.source: pack
+            for pack in TexturePack.objects.filter(source__isnull=False).prefetch_related('texture_set')
+        }
+
+        pack_by_pack_id = {}
+        for pack_id, tex_ids in ship_data['texture_ids'].items():
+            pack = existing.get(ship_data['texture_sources'][pack_id])
+            old_textures = {}
+
+            if pack is None:
+                pack = TexturePack.objects.create(pack_id=pack_id, source=ship_data['texture_sources'][pack_id])
+            else:
+                old_textures = {texture.tex_id: texture for texture in pack.texture_set.all()}
+                if pack.pack_id != int(pack_id):
+                    pack.pack_id = int(pack_id)
+                    pack.save(update_fields=['pack_id'])
+
+            for texture in self._get_textures(pack, pack_id, tex_ids, ship_data, hashes):
+                old_texture = old_textures.pop(texture.tex_id, None)
+                if old_texture is None:
+                    texture.save()
+                    continue
+
+                changed = [name for name in self.TEXTURE_FIELDS if getattr(old_texture, name) != getattr(texture, name)]
+                if changed:
+                    for name in changed:
+                        setattr(old_texture, name, getattr(texture, name))
+                    old_texture.save(update_fields=changed)
+
+            for old_texture in old_textures.values():
+                old_texture.delete()
+
+            pack_by_pack_id[int(pack_id)] = pack
+
+        return pack_by_pack_id
+
+    def _update_ships(self, data, pack_by_pack_id, hashes):
+        existing = {
+            ship.nickname: ship
+            for ship in Ship.objects.filter(nickname__isnull=False).prefetch_related('textures', 'shipmodellod_set')
+        }
+        # ships imported before nicknames were stored are matched by name once
+        legacy = {ship.name: ship for ship in Ship.objects.filter(nickname__isnull=True)}
+
+        seen = set()
+        for import_id in data:
+            fields = self._get_ship_fields(data[import_id])
+            ship = existing.get(fields['nickname']) or legacy.pop(fields['name'], None)
+
+            old_lods = {}
+            old_packs = set()
+            if ship is None:
+                ship = Ship.objects.create(**fields)
+            else:
+                changed = [
+                    name for name, value in fields.items()
+                    if getattr(ship, name) != Ship._meta.get_field(name).to_python(value)
+                ]
+                if changed:
+                    for name in changed:
+                        setattr(ship, name, fields[name])
+                    ship.save(update_fields=changed)
+
+                old_lods = {lod.lod_name: lod for lod in ship.shipmodellod_set.all()}
+                old_packs = {pack.pk for pack in ship.textures.all()}
+
+            new_packs = {pack_by_pack_id[pack_id].pk for pack_id in data[import_id]['texture_pack_ids']}
+            ship.textures.add(*(new_packs - old_packs))
+            ship.textures.remove(*(old_packs - new_packs))
+
+            for lod_name in data[import_id]['model_data']['lods']:
+                lod = self._get_model(ship, lod_name, import_id, hashes)
+                old_lod = old_lods.pop(lod_name, None)
+
+                if old_lod is None:
+                    lod.save()
+                elif old_lod.content_hash != lod.content_hash:
+                    old_lod.content_hash = lod.content_hash
+                    old_lod.save(update_fields=['content_hash'])
+
+            for lod in old_lods.values():
+                lod.delete()
+
+            seen.add(ship.pk)
+
+        Ship.objects.exclude(pk__in=seen).delete()
+
+    @staticmethod
+    def _get_source(ship_data, pack_id):
+        return ship_data.get('texture_sources', {}).get(pack_id)
 
     @classmethod
-    def _import_ships(cls, zf, data, pack_by_pack_id):
+    def _import_ships(cls, data, pack_by_pack_id, hashes):
         for import_id in data:
-            cls._import_ship(zf, data[import_id], import_id, pack_by_pack_id)
+            cls._import_ship(data[import_id], import_id, pack_by_pack_id, hashes)
             data[import_id] = None
 
 
     @classmethod
-    def _import_ship(cls, zf, data, import_id, pack_by_pack_id):
+    def _import_ship(cls, data, import_id, pack_by_pack_id, hashes):
+        ship = Ship.objects.create(**cls._get_ship_fields(data))
+
+        for pack_id in data['texture_pack_ids']:
+            ship.textures.add(pack_by_pack_id[pack_id])
+
+        for lod_name in data['model_data']['lods']:
+            cls._get_model(ship, lod_name, import_id, hashes).save()
+
+    @classmethod
+    def _get_ship_fields(cls, data):
         full_data = {}
 
         for key, target in cls.DIRECT_FIELDS.items():
@@ -82,82 +335,120 @@ class Command(BaseCommand):
             full_data[target + '_y'] = math.floor(float(parts[1]))
             full_data[target + '_z'] = math.floor(float(parts[2]))
 
-        ship = Ship.objects.create(**full_data)
+        return full_data
 
-        for pack_id in data['texture_pack_ids']:
-            ship.textures.add(pack_by_pack_id[pack_id])
+    @classmethod
+    def _get_model(cls, ship, lod_name, import_id, hashes):
+        """ the unsaved ShipModelLOD row """
+        return ShipModelLOD(
+            ship=ship,
+            lod_name=lod_name,
+            content_hash=hashes[cls._get_model_key(import_id, lod_name)],
+        )
 
-        for lod_name in data['model_data']['lods']:
-            cls._import_model(zf, ship, lod_name, import_id)
+    @staticmethod
+    def _get_model_key(import_id, lod_name):
+        """ zip member of the indexed mesh file, also the asset key of older packages """
+        return '{}.mesh.{}.dat'.format(import_id, lod_name.lower())
 
     @staticmethod
-    def _import_model(zf, ship, lod_name, import_id):
-        ShipModelLOD.objects.create(**{
-            'ship': ship,
-            'lod_name': lod_name,
-        })
-
-        vertices = zf.read('{}.vertices.{}.dat'.format(import_id, lod_name.lower()))
-        normals = zf.read('{}.normals.{}.dat'.format(import_id, lod_name.lower()))
-        uvs = zf.read('{}.uvs.{}.dat'.format(import_id, lod_name.lower()))
-        materials = zf.read('{}.materials.{}.dat'.format(import_id, lod_name.lower()))
-
-        data = struct.pack('I', len(vertices))
-        data += struct.pack('I', len(normals))
-        data += struct.pack('I', len(uvs))
-        data += struct.pack('I', len(materials))
-        data += vertices
-        data += normals
-        data += uvs
-        data += materials
-        
-        filename = 'static/models/{}.{}.dat'.format(ship.id,  lod_name)
-        with open(filename, 'wb') as handle:
-            handle.write(data)
+    def _get_model_members(import_id, lod_name):
+        """ the separate vertex, normal, uv and material files of packages without mesh files """
+        return [
+            '{}.{}.{}.dat'.format(import_id, part, lod_name.lower())
+            for part in ['vertices', 'normals', 'uvs', 'materials']
+        ]
 
     @classmethod
-    def _import_textures(cls, zf, texture_ids):
+    def _get_assets(cls, zf, ship_data):
+        """ every model and texture file of the package, keyed by its (first) zip member """
+        assets = {}
+        for import_id, data in ship_data['ships'].items():
+            for lod_name in data['model_data']['lods']:
+                key = cls._get_model_key(import_id, lod_name)
+                if key in zf.NameToInfo:
+                    assets[key] = Asset(cls.MODEL_DIR + '/{}.dat', [key])
+                else:
+                    members = cls._get_model_members(import_id, lod_name)
+                    assets[key] = Asset(cls.MODEL_DIR + '/{}.dat', members, with_header=True)
+
+        variant_suffixes = ['.{}'.format(size) for size in ship_data.get('texture_sizes', [])]
+        for pack_id, tex_ids in ship_data['texture_ids'].items():
+            for tex_id in tex_ids:
+                for suffix in ['', '.light', '.bump', '.meta'] + variant_suffixes:
+                    member = '{}.{}{}.tex'.format(pack_id, tex_id, suffix)
+                    if member in zf.NameToInfo:
+                        assets[member] = Asset(cls.TEXTURE_DIR + '/{}.tex', [member])
+
+        return assets
+
+    @staticmethod
+    def _get_used_files():
+        used = set()
+        for lod in ShipModelLOD.objects.only('ship_id', 'lod_name', 'content_hash'):
+            used.add(lod.get_path(''))
+
+        for texture in Texture.objects.all():
+            for adds in [None, 'light', 'bump', 'meta']:
+                path = texture.get_path('', adds)
+                if path:
+                    used.add(path)
+
+            used.update(texture.get_variant_paths('').values())
+
+        return used
+
+    @classmethod
+    def _import_textures(cls, texture_ids, ship_data, hashes):
         pack_by_pack_id = {}
         for pack_id in texture_ids:
-            pack = TexturePack.objects.create(pack_id=pack_id)
+            pack = TexturePack.objects.create(pack_id=pack_id, source=cls._get_source(ship_data, pack_id))
             pack_by_pack_id[int(pack_id)] = pack
 
-            for tex_id in texture_ids[pack_id]:
-                try:
-                    tex_data = zf.read('{}.{}.tex'.format(pack_id, tex_id))
-                except KeyError:
-                    print('could not find {}.{}.tex'.format(pack_id, tex_id))
-                    continue
+            for texture in cls._get_textures(pack, pack_id, texture_ids[pack_id], ship_data, hashes):
+                texture.save()
 
-                additions = cls._load_additions(zf, pack, pack_id, tex_id)
+        return pack_by_pack_id
 
-                data = {
-                    'tex_id': tex_id,
-                    'texture_pack': pack,
-                }
-                data.update(additions)
+    @classmethod
+    def _get_textures(cls, pack, pack_id, tex_ids, ship_data, hashes):
+        """ the unsaved Texture rows of a pack """
+        # packages built before texture formats were recorded only hold RGBA
+        formats = ship_data.get('texture_formats', {}).get(pack_id, {})
 
-                new_tex = Texture.objects.create(**data)
+        textures = []
+        for tex_id in tex_ids:
+            member = '{}.{}.tex'.format(pack_id, tex_id)
+            if member not in hashes:
+                print('could not find {}'.format(member))
+                continue
 
-                filename = 'static/textures/{}.{}.tex'.format(pack.id, tex_id)
-                with open(filename, 'wb') as handle:
-                    handle.write(tex_data)
+            data = {
+                'tex_id': tex_id,
+                'texture_pack': pack,
+                'content_hash': hashes[member],
+                'format': formats.get(str(tex_id), 'rgba'),
+                'variant_hashes': ' '.join(
+                    '{}:{}'.format(size, hashes['{}.{}.{}.tex'.format(pack_id, tex_id, size)])
+                    for size in sorted(ship_data.get('texture_sizes', []))
+                    if '{}.{}.{}.tex'.format(pack_id, tex_id, size) in hashes
+                ),
+            }
+            data.update(cls._load_additions(pack_id, tex_id, hashes))
 
-        return pack_by_pack_id
+            textures.append(Texture(**data))
+
+        return textures
 
     @classmethod
-    def _load_additions(cls, zf, pack, pack_id, tex_id):
+    def _load_additions(cls, pack_id, tex_id, hashes):
         result = {}
         for adds in ['light', 'bump', 'meta']:
-            try:
-                tex_data = zf.read('{}.{}.{}.tex'.format(pack_id, tex_id, adds))
-
-                filename = 'static/textures/{}.{}.{}.tex'.format(pack.id, tex_id, adds)
-                with open(filename, 'wb') as handle:
-                    handle.write(tex_data)
+            member = '{}.{}.{}.tex'.format(pack_id, tex_id, adds)
+            if member not in hashes:
+                continue
 
-                result['has_{}'.format(adds)] = True
-            except KeyError:
-                pass
+            result['has_{}'.format(adds)] = True
+            result['{}_hash'.format(adds)] = hashes[member]
 
         return result
@@ -0,0 +1,10 @@
+from django.middleware.gzip import GZipMiddleware as BaseGZipMiddleware
+
+
+class GZipMiddleware(BaseGZipMiddleware):
+    """ GZipMiddleware that skips responses marked with skip_gzip, e.g. precompressed assets """
+
+    def process_response(self, request, response):
+        if getattr(response, 'skip_gzip', False):
+            return response
+        return super(GZipMiddleware, self).process_response(request, response)
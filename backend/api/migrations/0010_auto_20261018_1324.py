@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 13:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_auto_20171027_1545'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ship',
+            name='nickname',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='texturepack',
+            name='source',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
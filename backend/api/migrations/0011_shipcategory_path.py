@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 13:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    ShipCategory = apps.get_model('api', 'ShipCategory')
+    categories = {category.id: category for category in ShipCategory.objects.all()}
+
+    def get_path(category):
+        if category.parent_category_id:
+            return get_path(categories[category.parent_category_id]) + ' > ' + category.name
+        return category.name
+
+    for category in categories.values():
+        category.path = get_path(category)
+        category.save(update_fields=['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_auto_20261018_1324'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipcategory',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=1024),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
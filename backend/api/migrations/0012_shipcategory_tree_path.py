@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 13:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_tree_paths(apps, schema_editor):
+    ShipCategory = apps.get_model('api', 'ShipCategory')
+    categories = {category.id: category for category in ShipCategory.objects.all()}
+
+    def get_tree_path(category):
+        if category.parent_category_id:
+            return '{}{}/'.format(get_tree_path(categories[category.parent_category_id]), category.id)
+        return '/{}/'.format(category.id)
+
+    for category in categories.values():
+        category.tree_path = get_tree_path(category)
+        category.save(update_fields=['tree_path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_shipcategory_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipcategory',
+            name='tree_path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='shipcategory',
+            index=models.Index(fields=['tree_path'], name='api_shipcat_tree_pa_be221e_idx'),
+        ),
+        migrations.RunPython(fill_tree_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 13:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_content_hashes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ship',
+            index=models.Index(fields=['price', 'id'], name='api_ship_price_aee15e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ship',
+            index=models.Index(fields=['mass', 'id'], name='api_ship_mass_6abc4a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ship',
+            index=models.Index(fields=['hitpoints', 'id'], name='api_ship_hitpoin_5baefc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ship',
+            index=models.Index(fields=['hold_size', 'id'], name='api_ship_hold_si_6de1b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ship',
+            index=models.Index(fields=['max_bats', 'id'], name='api_ship_max_bat_000ed5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ship',
+            index=models.Index(fields=['max_bots', 'id'], name='api_ship_max_bot_a2c299_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 13:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_ship_stat_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='texture',
+            name='format',
+            field=models.CharField(choices=[('rgba', 'RGBA'), ('dxt1', 'DXT1'), ('dxt5', 'DXT5')], default='rgba', max_length=8),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 13:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_texture_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='texture',
+            name='variant_hashes',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -3,6 +3,8 @@ import os
 
 from collections import defaultdict
 from django.db import models
+from django.db.models.signals import pre_delete, post_delete
+from django.dispatch import receiver
 from django.conf import settings
 
 
@@ -31,11 +33,26 @@ class ShipCategory(models.Model):
         null=True,
     )
 
+    # "parent > child" path, maintained on save so listings never walk the parents
+    path = models.CharField(
+        max_length=1024,
+        blank=True,
+        editable=False,
+    )
+
+    # "/root_id/.../own_id/", a prefix match selects a whole subtree
+    tree_path = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+
     class Meta:
         verbose_name = "Ship category"
         verbose_name_plural = "Ship categories"
         indexes = [
             models.Index(fields=['parent_category']),
+            models.Index(fields=['tree_path']),
         ]
         ordering = ['parent_category_id', 'name']
 
@@ -47,7 +64,7 @@ class ShipCategory(models.Model):
         result = {
             'id': self.id,
             'name': self.name,
-            'path': str(self),
+            'path': self.path,
             'description': self.description,
             'background': self._get_path(self.background_image) if self.background_image else None,
             'logo': self._get_path(self.logo) if self.logo else None,
@@ -79,8 +96,12 @@ class ShipCategory(models.Model):
         return result
 
     @staticmethod
-    def get_tree():
-        nodes_by_id = {node.id: node.to_dict(True) for node in ShipCategory.objects.iterator()}
+    def get_tree(root_category=None):
+        categories = ShipCategory.objects.all()
+        if root_category is not None:
+            categories = root_category.get_subtree()
+
+        nodes_by_id = {node.id: node.to_dict(True) for node in categories.iterator()}
         root = {
             'children': [],
         }
@@ -89,14 +110,23 @@ class ShipCategory(models.Model):
         sorted_nodes.sort(key=lambda x: x['path'])
 
         for node in sorted_nodes:
-            if node['parent_id'] is None:
-                root['children'].append(node)
-            else:
+            if node['parent_id'] in nodes_by_id:
                 nodes_by_id[node['parent_id']]['children'].append(node)
+            else:
+                root['children'].append(node)
 
-        root['children'].append(ShipCategory.get_null_category_dict(True))
+        if root_category is None:
+            root['children'].append(ShipCategory.get_null_category_dict(True))
 
         return root['children']
+
+    def get_subtree(self):
+        """ this category and all of its descendants in one indexed query """
+        return ShipCategory.objects.filter(tree_path__startswith=self.tree_path)
+
+    def get_subtree_ships(self):
+        # ordered, so snapshots and their hashes do not depend on the database
+        return Ship.objects.filter(category__tree_path__startswith=self.tree_path).order_by('id')
     
     def has_bg(self):
         return True if self.background_image else False
@@ -104,24 +134,75 @@ class ShipCategory(models.Model):
     def has_logo(self):
         return True if self.logo else False
 
-    def __str__(self):
-        if self.parent_category:
-            return str(self.parent_category) + ' > ' + self.name
+    def get_path(self):
+        if self.parent_category_id:
+            return self.parent_category.path + ' > ' + self.name
         return self.name
 
+    def get_tree_path(self):
+        if self.parent_category_id:
+            return '{}{}/'.format(self.parent_category.tree_path, self.id)
+        return '/{}/'.format(self.id)
+
+    def save(self, *args, **kwargs):
+        old_paths = (self.path, self.tree_path)
+        self.path = self.get_path()
+        super(ShipCategory, self).save(*args, **kwargs)
+
+        # the id is only known after the first insert
+        tree_path = self.get_tree_path()
+        if tree_path != self.tree_path:
+            self.tree_path = tree_path
+            ShipCategory.objects.filter(id=self.id).update(tree_path=tree_path)
+
+        if old_paths[1] and old_paths != (self.path, self.tree_path):
+            for child in ShipCategory.objects.filter(parent_category=self):
+                child.save()
+
+    def __str__(self):
+        return self.path or self.name
+
     def __unicode__(self):
         return self.name
 
 
+@receiver(pre_delete, sender=ShipCategory)
+def _remember_child_categories(sender, instance, **kwargs):
+    instance._child_ids = list(ShipCategory.objects.filter(parent_category=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=ShipCategory)
+def _update_orphaned_paths(sender, instance, **kwargs):
+    # children were detached by SET_NULL and are root categories now, their subtrees move along
+    for child in ShipCategory.objects.filter(id__in=getattr(instance, '_child_ids', [])):
+        child.save()
+
+
 class TexturePack(models.Model):
     pack_id = models.IntegerField()
 
+    # material library the pack was built from, stable across imports
+    source = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+
     def __str__(self):
         return 'TexturePack {}'.format(self.pack_id)
 
 
 class Ship(models.Model):
     name = models.CharField(max_length=64)
+
+    # shiparch nickname, stable key for differential imports
+    nickname = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        db_index=True,
+    )
     infocard = models.TextField()
     price = models.BigIntegerField()
     category = models.ForeignKey(
@@ -161,67 +242,73 @@ class Ship(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['category']),
+
+            # filter and keyset order of api/query.py
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['mass', 'id']),
+            models.Index(fields=['hitpoints', 'id']),
+            models.Index(fields=['hold_size', 'id']),
+            models.Index(fields=['max_bats', 'id']),
+            models.Index(fields=['max_bots', 'id']),
         ]
 
-    def to_dict(self, extended=False):
+    # extended values of to_dict, in output order
+    STAT_FIELDS = (
+        'infocard', 'max_bats', 'max_bots', 'hitpoints', 'hold_size', 'weapon_angle', 'mass',
+        'torgue_x', 'torgue_y', 'torgue_z', 'drag_x', 'drag_y', 'drag_z',
+        'inertia_y', 'inertia_x', 'inertia_z', 'nudge', 'strafe', 'strafe_power',
+    )
+    DETAIL_FIELDS = ('id', 'name', 'price', 'category') + STAT_FIELDS + ('lods', 'static_model_paths', 'texture_info')
+
+    @staticmethod
+    def with_details(fields=None):
+        """ ships with everything to_dict(True, fields) needs, in a fixed number of queries """
+        ships = Ship.objects.all()
+        if fields is None or 'category' in fields:
+            ships = ships.select_related('category')
+        if fields is None or 'lods' in fields or 'static_model_paths' in fields:
+            ships = ships.prefetch_related('shipmodellod_set')
+        if fields is None or 'texture_info' in fields:
+            ships = ships.prefetch_related('textures__texture_set')
+        return ships
+
+    def to_dict(self, extended=False, fields=None):
+        """ fields limits an extended dict to these keys (and id), the others are not computed """
+        if fields is None:
+            fields = self.DETAIL_FIELDS
+
         result_dict = {
             'id': self.id,
             'name': self.name,
             'price': self.price,
-            'category': self.category.to_dict() if self.category else ShipCategory.get_null_category_dict(),
         }
+        if 'category' in fields or not extended:
+            result_dict['category'] = self.category.to_dict() if self.category else ShipCategory.get_null_category_dict()
 
         if not extended:
             return result_dict
 
-        lods = self.get_lods()
-
-        result_dict.update({
-            'infocard': self.infocard,
-            'max_bats': self.max_bats,
-            'max_bots': self.max_bots,
-            'hitpoints': self.hitpoints,
-            'hold_size': self.hold_size,
-            'weapon_angle': self.weapon_angle,
-            'mass': self.mass,
-            'torgue_x': self.torgue_x,
-            'torgue_y': self.torgue_y,
-            'torgue_z': self.torgue_z,
-            'drag_x': self.drag_x,
-            'drag_y': self.drag_y,
-            'drag_z': self.drag_z,
-            'inertia_y': self.inertia_y,
-            'inertia_x': self.inertia_x,
-            'inertia_z': self.inertia_z,
-            'nudge': self.nudge,
-            'strafe': self.strafe,
-            'strafe_power': self.strafe_power,
-            'lods': lods,
-            'static_model_paths': {
-                lod: '{}static/models/{}.{}.dat'.format(settings.FL_PATH_PREFIX, self.id, lod)
-                for lod in lods
-            },
-            'texture_info': self.get_texture_info()
-        })
-        return result_dict
+        result_dict.update((name, getattr(self, name)) for name in self.STAT_FIELDS)
+
+        if 'lods' in fields or 'static_model_paths' in fields:
+            lods = list(self.shipmodellod_set.all())
+            result_dict['lods'] = [lod.lod_name for lod in lods]
+            result_dict['static_model_paths'] = {lod.lod_name: lod.get_path() for lod in lods}
+
+        if 'texture_info' in fields:
+            result_dict['texture_info'] = self.get_texture_info()
+
+        return {key: value for key, value in result_dict.items() if key == 'id' or key in fields}
 
     def get_lods(self):
-        return list(ShipModelLOD.objects.filter(ship=self).values_list('lod_name', flat=True))
+        # .all() so a prefetched LOD list is used
+        return [lod.lod_name for lod in self.shipmodellod_set.all()]
 
     def get_texture_info(self):
         result = {}
         for tex in self.textures.all():
-            textures = tex.texture_set.all()
-            prefix = '{}static/textures'.format(settings.FL_PATH_PREFIX)
-
-            for texture in textures:
-                sub = '{}/{}.{}'.format(prefix, tex.id, texture.tex_id)
-                result[texture.tex_id] = {
-                    'path': '{}.tex'.format(sub),
-                    'light_path': '{}.light.tex'.format(sub) if texture.has_light else None,
-                    'bump_path': '{}.bump.tex'.format(sub) if texture.has_bump else None,
-                    'meta_path': '{}.meta.tex'.format(sub) if texture.has_meta else None,
-                }
+            for texture in tex.texture_set.all():
+                result[texture.tex_id] = texture.get_info()
         return result
 
 
@@ -229,11 +316,26 @@ class ShipModelLOD(models.Model):
     ship = models.ForeignKey(Ship, on_delete=models.CASCADE)
     lod_name = models.CharField(max_length=10)
 
+    # sha1 of the model file, which is stored under this name
+    content_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        null=True,
+    )
+
     class Meta:
         indexes = [
             models.Index(fields=['ship', 'lod_name']),
         ]
 
+    def get_path(self, prefix=None):
+        prefix = settings.FL_PATH_PREFIX if prefix is None else prefix
+        if self.content_hash:
+            return '{}static/models/{}.dat'.format(prefix, self.content_hash)
+
+        # imported before files were content addressed
+        return '{}static/models/{}.{}.dat'.format(prefix, self.ship_id, self.lod_name)
+
 
 class Texture(models.Model):
     tex_id = models.IntegerField()
@@ -254,7 +356,63 @@ class Texture(models.Model):
         default=False
     )
 
+    # sha1 of the texture files, which are stored under these names
+    content_hash = models.CharField(max_length=40, blank=True, null=True)
+    light_hash = models.CharField(max_length=40, blank=True, null=True)
+    bump_hash = models.CharField(max_length=40, blank=True, null=True)
+    meta_hash = models.CharField(max_length=40, blank=True, null=True)
+
+    # "size:sha1" of the size capped variants, space separated, smallest first
+    variant_hashes = models.TextField(blank=True, default='')
+
+    # encoding of the texture file, the header of the file says the same
+    format = models.CharField(
+        max_length=8,
+        choices=[('rgba', 'RGBA'), ('dxt1', 'DXT1'), ('dxt5', 'DXT5')],
+        default='rgba',
+    )
+
     class Meta:
         indexes = [
             models.Index(fields=['tex_id']),
         ]
+
+    def get_path(self, prefix=None, adds=None):
+        """ path of the texture or one of its light, bump or meta additions, None if it has none """
+        prefix = settings.FL_PATH_PREFIX if prefix is None else prefix
+        if adds and not getattr(self, 'has_{}'.format(adds)):
+            return None
+
+        content_hash = getattr(self, '{}_hash'.format(adds) if adds else 'content_hash')
+        if content_hash:
+            return '{}static/textures/{}.tex'.format(prefix, content_hash)
+
+        # imported before files were content addressed
+        return '{}static/textures/{}.{}{}.tex'.format(
+            prefix, self.texture_pack_id, self.tex_id, '.{}'.format(adds) if adds else '',
+        )
+
+    def get_variants(self):
+        """ [(longest side, sha1), ...] of the size capped variants """
+        variants = []
+        for entry in self.variant_hashes.split():
+            size, _, content_hash = entry.partition(':')
+            variants.append((int(size), content_hash))
+        return variants
+
+    def get_variant_paths(self, prefix=None):
+        """ {longest side: path} of the size capped variants """
+        prefix = settings.FL_PATH_PREFIX if prefix is None else prefix
+        return {
+            size: '{}static/textures/{}.tex'.format(prefix, content_hash)
+            for size, content_hash in self.get_variants()
+        }
+
+    def get_info(self):
+        return {
+            'path': self.get_path(),
+            'light_path': self.get_path(adds='light'),
+            'bump_path': self.get_path(adds='bump'),
+            'meta_path': self.get_path(adds='meta'),
+            'variants': self.get_variant_paths(),
+        }
@@ -0,0 +1,148 @@
+"""
+filtered, sorted and keyset paginated ship listings for /api/ships/query.
+
+    price__gte=1000&mass__lt=200    range filters, lookups gt, gte, lt, lte
+    category=5                      ships of a category subtree
+    sort=-price,name                sort keys, - for descending, id breaks ties
+    limit=50                        page size
+    after=<cursor>                  the next page, taken from the "next" of the previous one
+    fields=price,mass               sparse fieldset, see Ship.DETAIL_FIELDS
+
+the cursor holds the sort values of the last row, so a page is a range scan
+on the (stat, id) indexes of Ship instead of an OFFSET.
+"""
+import json
+import base64
+import binascii
+
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .models import Ship, ShipCategory
+
+FILTER_FIELDS = ('price', 'mass', 'hitpoints', 'hold_size', 'max_bats', 'max_bots')
+SORT_FIELDS = FILTER_FIELDS + ('name', 'id')
+LOOKUPS = ('gt', 'gte', 'lt', 'lte')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class QueryError(ValueError):
+    pass
+
+
+class ShipQuery(object):
+    def __init__(self, params):
+        self.filters = self._get_filters(params)
+        self.category_id = self._get_int(params, 'category', None)
+        self.sort_keys = self._get_sort_keys(params.get('sort', ''))
+        self.limit = min(max(self._get_int(params, 'limit', DEFAULT_LIMIT), 1), MAX_LIMIT)
+        self.after = self._decode_cursor(params.get('after')) if params.get('after') else None
+
+        fields = params.get('fields')
+        self.fields = fields.split(',') if fields else None
+        unknown = set(self.fields or []) - set(Ship.DETAIL_FIELDS)
+        if unknown:
+            raise QueryError('unknown fields: {}'.format(', '.join(sorted(unknown))))
+
+    def get_page(self):
+        """ {'results': [...], 'next': cursor of the next page or None} """
+        ships = Ship.with_details(self.fields) if self.fields else Ship.objects.select_related('category')
+        ships = ships.filter(**self.filters)
+
+        if self.category_id is not None:
+            category = ShipCategory.objects.filter(id=self.category_id).first()
+            if category is None:
+                raise QueryError('unknown category {}'.format(self.category_id))
+            ships = ships.filter(category__tree_path__startswith=category.tree_path)
+
+        if self.after is not None:
+            ships = ships.filter(self._get_after_filter(self.after))
+
+        order = ['-{}'.format(field) if descending else field for field, descending in self.sort_keys]
+        page = list(ships.order_by(*order)[:self.limit + 1])
+
+        next_cursor = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            next_cursor = self._encode_cursor([getattr(page[-1], field) for field, _ in self.sort_keys])
+
+        return {
+            'results': [ship.to_dict(self.fields is not None, self.fields) for ship in page],
+            'next': next_cursor,
+        }
+
+    @staticmethod
+    def _get_int(params, name, default):
+        try:
+            return int(params[name]) if params.get(name) else default
+        except ValueError:
+            raise QueryError('{} must be a number'.format(name))
+
+    @staticmethod
+    def _get_filters(params):
+        filters = {}
+        for name, value in params.items():
+            field, _, lookup = name.partition('__')
+            if field not in FILTER_FIELDS:
+                continue
+            if lookup not in LOOKUPS:
+                raise QueryError('{} supports {}'.format(field, ', '.join(LOOKUPS)))
+
+            try:
+                filters[name] = Ship._meta.get_field(field).to_python(value)
+            except (ValidationError, ValueError, TypeError):
+                # to_python reports bad input as ValidationError
+                raise QueryError('{} must be a number'.format(name))
+        return filters
+
+    @staticmethod
+    def _get_sort_keys(sort):
+        keys = []
+        for key in sort.split(','):
+            field = key.lstrip('-')
+            if not field:
+                continue
+            if field not in SORT_FIELDS:
+                raise QueryError('can not sort by {}, only by {}'.format(field, ', '.join(SORT_FIELDS)))
+            keys.append((field, key.startswith('-')))
+
+        # the id makes the order total, which the cursor relies on
+        if 'id' not in [field for field, _ in keys]:
+            keys.append(('id', False))
+        return keys
+
+    def _get_after_filter(self, values):
+        """ rows behind values in sort order: k1 > v1 or (k1 = v1 and k2 > v2) or ... """
+        alternatives = []
+        equal = Q()
+        for (field, descending), value in zip(self.sort_keys, values):
+            alternatives.append(equal & Q(**{'{}__{}'.format(field, 'lt' if descending else 'gt'): value}))
+            equal &= Q(**{field: value})
+
+        # the redundant bound on the first key lets the database use its index for a range scan
+        field, descending = self.sort_keys[0]
+        first_bound = Q(**{'{}__{}'.format(field, 'lte' if descending else 'gte'): values[0]})
+        return first_bound & reduce(or_, alternatives)
+
+    def _encode_cursor(self, values):
+        data = json.dumps([self._get_sort_spec(), values]).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def _decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            sort_spec, values = json.loads(data.decode('utf-8'))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise QueryError('invalid cursor')
+
+        if sort_spec != self._get_sort_spec() or len(values) != len(self.sort_keys):
+            raise QueryError('the cursor belongs to a different sort order')
+        return values
+
+    def _get_sort_spec(self):
+        return ','.join('-' + field if descending else field for field, descending in self.sort_keys)
@@ -1,3 +1,558 @@
-from django.test import TestCase
+import io
+import os
+import gzip
+import shutil
+import tempfile
 
-# Create your tests here.
+from zipfile import ZipFile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from .assets import Asset, AssetWriter, get_sidecar_paths, write_sidecars
+from .cache import bump_data_version, get_data_version
+from .models import Ship, ShipCategory, ShipModelLOD, Texture, TexturePack
+
+
+def create_ship(category, name='ship'):
+    return Ship.objects.create(
+        name=name, infocard='', price=1000, category=category,
+        max_bats=10, max_bots=10, hitpoints=1000, hold_size=20, weapon_angle=30, mass=100,
+        torgue_x=1, torgue_y=1, torgue_z=1, drag_x=1, drag_y=1, drag_z=1,
+        inertia_x=1, inertia_y=1, inertia_z=1, nudge=1, strafe=1, strafe_power=1, linear_drag=1,
+    )
+
+
+class DataVersionMixin(object):
+    """ every test gets its own data version file, so no cached response leaks between tests """
+
+    def setUp(self):
+        super(DataVersionMixin, self).setUp()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        overridden = self.settings(API_DATA_VERSION_FILE=os.path.join(tmp_dir, 'data_version'))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        bump_data_version()
+
+
+class ApiTestCase(DataVersionMixin, TestCase):
+    pass
+
+
+class CategoryPathTest(TestCase):
+    def setUp(self):
+        self.root = ShipCategory.objects.create(name='Liberty')
+        self.child = ShipCategory.objects.create(name='Fighters', parent_category=self.root)
+        self.leaf = ShipCategory.objects.create(name='Heavy', parent_category=self.child)
+
+    def test_path_is_stored(self):
+        self.assertEqual(ShipCategory.objects.get(id=self.leaf.id).path, 'Liberty > Fighters > Heavy')
+
+    def test_tree_path_is_stored(self):
+        leaf = ShipCategory.objects.get(id=self.leaf.id)
+        self.assertEqual(leaf.tree_path, '/{}/{}/{}/'.format(self.root.id, self.child.id, self.leaf.id))
+
+    def test_move_updates_subtree(self):
+        other = ShipCategory.objects.create(name='Rheinland')
+        self.child.parent_category = other
+        self.child.save()
+
+        leaf = ShipCategory.objects.get(id=self.leaf.id)
+        self.assertEqual(leaf.path, 'Rheinland > Fighters > Heavy')
+        self.assertEqual(leaf.tree_path, '/{}/{}/{}/'.format(other.id, self.child.id, self.leaf.id))
+        self.assertEqual(list(self.root.get_subtree()), [self.root])
+
+    def test_rename_updates_descendants(self):
+        self.root.name = 'Bretonia'
+        self.root.save()
+
+        self.assertEqual(ShipCategory.objects.get(id=self.leaf.id).path, 'Bretonia > Fighters > Heavy')
+
+    def test_delete_updates_orphans(self):
+        self.root.delete()
+
+        leaf = ShipCategory.objects.get(id=self.leaf.id)
+        self.assertEqual(leaf.path, 'Fighters > Heavy')
+        self.assertEqual(leaf.tree_path, '/{}/{}/'.format(self.child.id, self.leaf.id))
+
+    def test_get_tree(self):
+        tree = ShipCategory.get_tree()
+
+        self.assertEqual([node['name'] for node in tree], ['Liberty', 'Uncathegorized'])
+        self.assertEqual(tree[0]['children'][0]['children'][0]['path'], 'Liberty > Fighters > Heavy')
+        self.assertEqual([node['name'] for node in ShipCategory.get_tree(self.child)], ['Fighters'])
+
+
+class ShipListingQueryTest(ApiTestCase):
+    def setUp(self):
+        super(ShipListingQueryTest, self).setUp()
+        root = ShipCategory.objects.create(name='Liberty')
+        self.category = ShipCategory.objects.create(name='Fighters', parent_category=root)
+
+    def _add_ships(self, count):
+        for index in range(count):
+            create_ship(self.category, 'ship {}'.format(index))
+        bump_data_version()
+
+    def test_ship_list_query_count(self):
+        for count in [1, 30]:
+            self._add_ships(count)
+
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/categories/{}/ships'.format(self.category.id))
+
+            ships = response.json()
+            self.assertEqual(ships[0]['category']['path'], 'Liberty > Fighters')
+
+    def test_category_detail_query_count(self):
+        for count in [1, 30]:
+            self._add_ships(count)
+
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/categories/{}'.format(self.category.id))
+
+            self.assertEqual(response.json()['ships'][0]['category']['path'], 'Liberty > Fighters')
+
+    def test_subtree_ships_query_count(self):
+        parent = self.category
+        for depth in range(5):
+            parent = ShipCategory.objects.create(name='level {}'.format(depth), parent_category=parent)
+            create_ship(parent, 'ship {}'.format(depth))
+        bump_data_version()
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/categories/{}'.format(self.category.id))
+
+        self.assertEqual(len(response.json()['ships']), 5)
+        self.assertFalse(response.json()['is_leaf'])
+
+
+class ShipDetailsQueryTest(ApiTestCase):
+    def setUp(self):
+        super(ShipDetailsQueryTest, self).setUp()
+        category = ShipCategory.objects.create(name='Liberty')
+        self.ship = create_ship(ShipCategory.objects.create(name='Fighters', parent_category=category))
+
+        for lod_name in ['level0', 'level1', 'level2']:
+            ShipModelLOD.objects.create(ship=self.ship, lod_name=lod_name)
+
+        for pack_id in range(25):
+            pack = TexturePack.objects.create(pack_id=pack_id)
+            self.ship.textures.add(pack)
+
+            for index in range(4):
+                Texture.objects.create(tex_id=pack_id * 10 + index, texture_pack=pack, has_light=index % 2 == 0)
+
+    def test_details_query_count(self):
+        # ship with category, LODs, texture packs, textures
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/ships/{}'.format(self.ship.id))
+
+        details = response.json()
+        self.assertEqual(details['lods'], ['level0', 'level1', 'level2'])
+        self.assertEqual(len(details['texture_info']), 100)
+        self.assertEqual(details['category']['path'], 'Liberty > Fighters')
+
+
+class ResponseCacheTest(ApiTestCase):
+    def setUp(self):
+        super(ResponseCacheTest, self).setUp()
+        self.category = ShipCategory.objects.create(name='Liberty')
+        self.ship = create_ship(self.category)
+        self.path = '/api/ships/{}'.format(self.ship.id)
+
+    def test_cached_response(self):
+        first = self.client.get(self.path)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.path)
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_not_modified(self):
+        etag = self.client.get(self.path)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_version_bump_invalidates(self):
+        etag = self.client.get(self.path)['ETag']
+        Ship.objects.filter(id=self.ship.id).update(name='renamed')
+        bump_data_version()
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'renamed')
+
+    def test_missing_ship_is_not_cached(self):
+        self.assertEqual(self.client.get('/api/ships/0').status_code, 404)
+        self.assertNotIn('ETag', self.client.get('/api/ships/0'))
+
+    def test_wildcard_needs_existing_resource(self):
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        self.assertEqual(self.client.get('/api/ships/0', HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+
+class AdminInvalidationTest(DataVersionMixin, TransactionTestCase):
+    # the version is bumped on commit, which TestCase never does
+    def setUp(self):
+        super(AdminInvalidationTest, self).setUp()
+        self.category = ShipCategory.objects.create(name='Liberty')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def test_admin_save_bumps_version(self):
+        version = get_data_version()
+        response = self.client.post('/admin/api/shipcategory/{}/change/'.format(self.category.id), {
+            'name': 'Bretonia',
+            'description': '',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertNotEqual(get_data_version(), version)
+
+
+class SnapshotExportTest(ApiTestCase):
+    def setUp(self):
+        super(SnapshotExportTest, self).setUp()
+        category = ShipCategory.objects.create(name='Liberty')
+        self.ship = create_ship(ShipCategory.objects.create(name='Fighters', parent_category=category))
+        create_ship(None, 'uncategorized')
+
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def _export(self):
+        call_command('export_snapshot', output=self.output, stdout=io.StringIO())
+
+    def test_snapshot_matches_api(self):
+        self._export()
+
+        paths = ['categories', 'categories/0', 'ships/{}'.format(self.ship.id)]
+        paths += ['categories/{}/ships'.format(category.id) for category in ShipCategory.objects.all()]
+        for path in paths:
+            filename = os.path.join(self.output, path + '.json')
+            content = self.client.get('/api/' + path).content
+
+            with open(filename, 'rb') as file:
+                self.assertEqual(file.read(), content)
+            with gzip.open(filename + '.gz', 'rb') as file:
+                self.assertEqual(file.read(), content)
+
+    def test_removed_ship_is_removed(self):
+        self._export()
+        self.ship.delete()
+        self._export()
+
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'ships', '{}.json'.format(self.ship.id))))
+
+    def test_foreign_files_survive(self):
+        foreign = os.path.join(self.output, 'ships', 'model.dat')
+        os.makedirs(os.path.dirname(foreign))
+        with open(foreign, 'wb') as file:
+            file.write(b'asset')
+
+        self._export()
+        self.assertTrue(os.path.isfile(foreign))
+
+
+class InMemoryDatasetTest(ApiTestCase):
+    def setUp(self):
+        super(InMemoryDatasetTest, self).setUp()
+        root = ShipCategory.objects.create(name='Liberty', description='house')
+        self.category = ShipCategory.objects.create(name='Fighters', parent_category=root)
+        leaf = ShipCategory.objects.create(name='Heavy', parent_category=self.category)
+        ShipCategory.objects.create(name='Rheinland')
+
+        self.ship = create_ship(self.category, 'Patriot')
+        create_ship(leaf, 'Defender')
+        create_ship(None, 'uncategorized')
+
+        ShipModelLOD.objects.create(ship=self.ship, lod_name='level0')
+        pack = TexturePack.objects.create(pack_id=1)
+        self.ship.textures.add(pack)
+        Texture.objects.create(tex_id=10, texture_pack=pack, has_bump=True)
+
+        self.paths = ['/api/categories', '/api/categories/0', '/api/ships/{}'.format(self.ship.id)]
+        for category in ShipCategory.objects.all():
+            self.paths += ['/api/categories/{}'.format(category.id), '/api/categories/{}/ships'.format(category.id)]
+
+    def _get_all(self):
+        bump_data_version()
+        return [self.client.get(path).json() for path in self.paths]
+
+    def test_same_content_as_database(self):
+        expected = self._get_all()
+        with self.settings(API_IN_MEMORY_DATASET=True):
+            self.assertEqual(self._get_all(), expected)
+
+    def test_no_queries_once_loaded(self):
+        with self.settings(API_IN_MEMORY_DATASET=True):
+            self._get_all()
+            # a query string keeps the response cache out of the way
+            with self.assertNumQueries(0):
+                self.client.get('/api/ships/{}?uncached'.format(self.ship.id))
+                self.client.get('/api/categories/{}?uncached'.format(self.category.id))
+
+    def test_reload_on_version_change(self):
+        with self.settings(API_IN_MEMORY_DATASET=True):
+            self._get_all()
+            Ship.objects.filter(id=self.ship.id).update(name='Hawk')
+            self.assertEqual(self._get_all()[2]['name'], 'Hawk')
+
+    def test_missing_ship(self):
+        with self.settings(API_IN_MEMORY_DATASET=True):
+            self.assertEqual(self.client.get('/api/ships/0').status_code, 404)
+
+
+class AssetViewTest(TestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+
+        overridden = self.settings(BASE_DIR=self.base_dir)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        os.makedirs(os.path.join(self.base_dir, 'static', 'models'))
+        self.filename = os.path.join(self.base_dir, 'static', 'models', '1.level0.dat')
+        self.content = bytes(range(256)) * 64
+        with open(self.filename, 'wb') as file:
+            file.write(self.content)
+
+        self.url = '/static/models/1.level0.dat'
+
+    def _get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_identity(self):
+        response, content = self._get(HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(content, self.content)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_sidecars(self):
+        write_sidecars(self.filename)
+
+        for encoding in get_sidecar_paths(self.filename):
+            response, content = self._get(HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(response['Content-Encoding'], encoding)
+
+            with open(get_sidecar_paths(self.filename)[encoding], 'rb') as file:
+                self.assertEqual(content, file.read())
+
+        with gzip.open(get_sidecar_paths(self.filename)['gzip']) as file:
+            self.assertEqual(file.read(), self.content)
+
+        response, _ = self._get(HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_range(self):
+        write_sidecars(self.filename)
+
+        response, content = self._get(HTTP_RANGE='bytes=100-199', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/{}'.format(len(self.content)))
+        self.assertEqual(content, self.content[100:200])
+
+        response, content = self._get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(content, self.content[-10:])
+
+        response, _ = self._get(HTTP_RANGE='bytes={}-'.format(len(self.content)))
+        self.assertEqual(response.status_code, 416)
+
+    def test_not_modified(self):
+        response, _ = self._get()
+
+        response, content = self._get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(content, b'')
+
+    def test_not_modified_sidecar(self):
+        write_sidecars(self.filename)
+
+        for encoding in get_sidecar_paths(self.filename):
+            response, _ = self._get(HTTP_ACCEPT_ENCODING=encoding)
+            self.assertTrue(response['ETag'].endswith('-{}"'.format(encoding)))
+
+            response, content = self._get(HTTP_ACCEPT_ENCODING=encoding, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(content, b'')
+
+    def test_malformed_quality(self):
+        write_sidecars(self.filename)
+
+        response, _ = self._get(HTTP_ACCEPT_ENCODING='br;q=high, gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_missing_file(self):
+        self.assertEqual(self.client.get('/static/models/2.level0.dat').status_code, 404)
+
+    def test_content_addressed_is_immutable(self):
+        self.assertFalse(self._get()[0].has_header('Cache-Control'))
+
+        self.url = '/static/models/{}.dat'.format('a' * 40)
+        os.rename(self.filename, os.path.join(self.base_dir, 'static', 'models', '{}.dat'.format('a' * 40)))
+        response, _ = self._get()
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response, _ = self._get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+class AssetWriterTest(TestCase):
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.target_dir)
+
+        self.zip_path = os.path.join(self.target_dir, 'import.zip')
+        with ZipFile(self.zip_path, 'w') as zf:
+            zf.writestr('1.level0.dat', b'model')
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        assets = [Asset(os.path.join(self.target_dir, '{}.dat'), ['1.level0.dat', 'missing.dat'])]
+
+        with self.assertRaises(KeyError):
+            AssetWriter(self.zip_path, workers=1).write_all(assets)
+        self.assertEqual(os.listdir(self.target_dir), ['import.zip'])
+
+
+class ContentHashPathTest(ApiTestCase):
+    def test_paths(self):
+        ship = create_ship(None)
+        ShipModelLOD.objects.create(ship=ship, lod_name='level0', content_hash='a' * 40)
+        ShipModelLOD.objects.create(ship=ship, lod_name='level1')
+
+        pack = TexturePack.objects.create(pack_id=1)
+        ship.textures.add(pack)
+        Texture.objects.create(
+            tex_id=10, texture_pack=pack, content_hash='b' * 40, has_light=True, light_hash='c' * 40,
+            variant_hashes='256:{} 512:{}'.format('d' * 40, 'e' * 40),
+        )
+
+        details = self.client.get('/api/ships/{}'.format(ship.id)).json()
+        self.assertEqual(details['static_model_paths'], {
+            'level0': '/static/models/{}.dat'.format('a' * 40),
+            'level1': '/static/models/{}.level1.dat'.format(ship.id),
+        })
+        self.assertEqual(details['texture_info']['10'], {
+            'path': '/static/textures/{}.tex'.format('b' * 40),
+            'light_path': '/static/textures/{}.tex'.format('c' * 40),
+            'bump_path': None,
+            'meta_path': None,
+            'variants': {
+                '256': '/static/textures/{}.tex'.format('d' * 40),
+                '512': '/static/textures/{}.tex'.format('e' * 40),
+            },
+        })
+
+
+class ShipBatchTest(ApiTestCase):
+    def setUp(self):
+        super(ShipBatchTest, self).setUp()
+        category = ShipCategory.objects.create(name='Liberty')
+        self.ships = [create_ship(category, 'ship {}'.format(index)) for index in range(20)]
+
+        for ship in self.ships:
+            ShipModelLOD.objects.create(ship=ship, lod_name='level0')
+            pack = TexturePack.objects.create(pack_id=ship.id)
+            ship.textures.add(pack)
+            Texture.objects.create(tex_id=ship.id, texture_pack=pack)
+
+        self.ids = ','.join(str(ship.id) for ship in reversed(self.ships))
+
+    def test_batch_query_count(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/ships?ids={}'.format(self.ids))
+
+        ships = response.json()
+        self.assertEqual([ship['id'] for ship in ships], [ship.id for ship in reversed(self.ships)])
+        self.assertEqual(ships[0], self.client.get('/api/ships/{}'.format(self.ships[-1].id)).json())
+
+    def test_fields(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/ships?ids={}&fields=price,mass'.format(self.ids))
+
+        self.assertEqual(response.json()[0], {'id': self.ships[-1].id, 'price': 1000, 'mass': 100})
+
+    def test_same_content_in_memory(self):
+        path = '/api/ships?ids={},0&fields=name,lods,texture_info'.format(self.ids)
+        expected = self.client.get(path).json()
+
+        with self.settings(API_IN_MEMORY_DATASET=True):
+            bump_data_version()
+            self.assertEqual(self.client.get(path).json(), expected)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/ships?ids=1,a').status_code, 400)
+        self.assertEqual(self.client.get('/api/ships?ids=1&fields=password').status_code, 400)
+        self.assertEqual(self.client.get('/api/ships?ids=' + ','.join(['1'] * 101)).status_code, 400)
+
+
+class ShipQueryTest(ApiTestCase):
+    def setUp(self):
+        super(ShipQueryTest, self).setUp()
+        self.category = ShipCategory.objects.create(name='Liberty')
+        other = ShipCategory.objects.create(name='Rheinland')
+
+        for index in range(30):
+            ship = create_ship(self.category if index % 3 else other, 'ship {}'.format(index))
+            ship.price = (index % 7) * 1000
+            ship.mass = 100 + index % 4
+            ship.save()
+
+    def _query(self, params):
+        response = self.client.get('/api/ships/query', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _walk(self, params):
+        ships = []
+        page = self._query(params)
+        while True:
+            ships += page['results']
+            if not page['next']:
+                return ships
+            page = self._query(dict(params, after=page['next']))
+
+    def test_keyset_pagination(self):
+        expected = list(Ship.objects.filter(mass__gte=101).order_by('-price', 'mass', 'id').values_list('id', flat=True))
+        ships = self._walk({'mass__gte': '101', 'sort': '-price,mass', 'limit': '4'})
+
+        self.assertEqual([ship['id'] for ship in ships], expected)
+
+    def test_filters_and_category(self):
+        ships = self._walk({'price__gte': '2000', 'price__lt': '5000', 'category': self.category.id})
+
+        self.assertTrue(ships)
+        for ship in ships:
+            self.assertTrue(2000 <= ship['price'] < 5000)
+            self.assertEqual(ship['category']['id'], self.category.id)
+
+    def test_sparse_fields(self):
+        ship = self._query({'sort': 'name', 'limit': '1', 'fields': 'hitpoints,mass'})['results'][0]
+        self.assertEqual(set(ship), {'id', 'hitpoints', 'mass'})
+
+    def test_query_count(self):
+        with self.assertNumQueries(1):
+            self._query({'price__gt': '0', 'sort': '-mass', 'limit': '10'})
+
+    def test_invalid_queries(self):
+        cursor = self._query({'sort': 'price', 'limit': '1'})['next']
+
+        for params in [
+            {'price__in': '1'},
+            {'mass__gt': 'heavy'},
+            {'sort': 'infocard'},
+            {'after': 'not a cursor'},
+            {'sort': 'mass', 'after': cursor},
+            {'fields': 'password'},
+        ]:
+            self.assertEqual(self.client.get('/api/ships/query', params).status_code, 400, params)
@@ -1,4 +1,4 @@
-from .views import CategoryDetailView, CategoryListView, ShipListView, ShipDetailsView
+from .views import CategoryDetailView, CategoryListView, ShipBatchView, ShipListView, ShipDetailsView, ShipQueryView
 from django.conf.urls import url
 
 
@@ -9,5 +9,7 @@ urlpatterns = [
     url(r'^categories$', CategoryListView.as_view()),
     url(r'^{}$'.format(category_rx), CategoryDetailView.as_view()),
     url(r'^{}/ships$'.format(category_rx), ShipListView.as_view()),
+    url(r'^ships$', ShipBatchView.as_view()),
+    url(r'^ships/query$', ShipQueryView.as_view()),
     url(r'^{}$'.format(ship_rx), ShipDetailsView.as_view()),
 ]
\ No newline at end of file
@@ -1,64 +1,254 @@
+import os
+import re
 import struct
 
+from django.conf import settings
 from django.views.generic.base import View
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 
+from . import dataset
+from .assets import COPY_CHUNK_SIZE, get_sidecar_paths
+from .cache import CachedResponseMixin
+from .query import QueryError, ShipQuery
 from .utils import JSONResponse, BinaryResponse
 from .models import Ship, ShipCategory, ShipModelLOD, Texture
 
 
-class ShipListView(View):
+class ShipListView(CachedResponseMixin, View):
     def get(self, request, category_id, *args, **kwargs):
+        if dataset.is_enabled():
+            return JSONResponse(dataset.get_dataset().get_ship_list(category_id))
+
         category = get_object_or_404(ShipCategory, id=category_id)
-        ships = Ship.objects.filter(category=category)
+        ships = Ship.objects.filter(category=category).select_related('category')
 
         return JSONResponse([ship.to_dict() for ship in ships])
 
 
-class ShipDetailsView(View):
+class ShipDetailsView(CachedResponseMixin, View):
     def get(self, request, ship_id, *args, **kwargs):
-        ship = get_object_or_404(Ship, id=ship_id)
+        if dataset.is_enabled():
+            return JSONResponse(dataset.get_dataset().get_ship_details(ship_id))
+
+        ship = get_object_or_404(Ship.with_details(), id=ship_id)
         return JSONResponse(ship.to_dict(True))
 
 
-class CategoryListView(View):
+class ShipBatchView(CachedResponseMixin, View):
+    """ details of several ships in one response, /api/ships?ids=1,2,3&fields=price,mass """
+
+    MAX_SHIPS = 100
+
     def get(self, request, *args, **kwargs):
-        categories = ShipCategory.get_tree()
-        return JSONResponse([cat for cat in categories])
+        try:
+            ship_ids = [int(ship_id) for ship_id in request.GET.get('ids', '').split(',') if ship_id]
+        except ValueError:
+            return JSONResponse({'error': 'ids must be a comma separated list of ship ids'}, 400)
 
+        if len(ship_ids) > self.MAX_SHIPS:
+            return JSONResponse({'error': 'at most {} ships per request'.format(self.MAX_SHIPS)}, 400)
 
-class CategoryDetailView(View):
-    def _get_children(self, cat_ids):
-        sub_cats = list(
-            ShipCategory.objects.filter(parent_category_id__in=cat_ids).values_list('id', flat=True)
-        )
+        fields = request.GET.get('fields')
+        fields = fields.split(',') if fields else None
+        unknown = set(fields or []) - set(Ship.DETAIL_FIELDS)
+        if unknown:
+            return JSONResponse({'error': 'unknown fields: {}'.format(', '.join(sorted(unknown)))}, 400)
 
-        if sub_cats:
-            sub_cats += self._get_children(sub_cats)
+        if dataset.is_enabled():
+            return JSONResponse(dataset.get_dataset().get_ships(ship_ids, fields))
+
+        ships = {ship.id: ship for ship in Ship.with_details(fields).filter(id__in=ship_ids)}
+        return JSONResponse([ships[ship_id].to_dict(True, fields) for ship_id in ship_ids if ship_id in ships])
+
+
+class ShipQueryView(CachedResponseMixin, View):
+    """ filtered, sorted and paginated ships, see api/query.py for the parameters """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return JSONResponse(ShipQuery(request.GET).get_page())
+        except QueryError as error:
+            return JSONResponse({'error': str(error)}, 400)
 
-        return sub_cats
 
+class CategoryListView(CachedResponseMixin, View):
+    def get(self, request, *args, **kwargs):
+        if dataset.is_enabled():
+            return JSONResponse(dataset.get_dataset().get_tree())
+
+        categories = ShipCategory.get_tree()
+        return JSONResponse([cat for cat in categories])
+
+
+class CategoryDetailView(CachedResponseMixin, View):
     def _get_ships(self, category_id):
         category = get_object_or_404(ShipCategory, id=category_id)
-        
-        cat_ids = self._get_children([category_id])
-        cat_ids += [category_id]
+        ships = category.get_subtree_ships().select_related('category')
 
         cat_dict = category.to_dict()
-        cat_dict['ships'] = [ship.to_dict() for ship in Ship.objects.filter(category_id__in=cat_ids)]
-        cat_dict['is_leaf'] = len(cat_ids) == 1
+        cat_dict['ships'] = [ship.to_dict() for ship in ships]
+        cat_dict['is_leaf'] = not ShipCategory.objects.filter(parent_category=category).exists()
 
         return  JSONResponse(cat_dict)
 
     def _get_uncategorized_ships(self):
         cat_dict = ShipCategory.get_null_category_dict()
-        cat_dict['ships'] = [ship.to_dict() for ship in Ship.objects.filter(category_id__isnull=True)]
+        cat_dict['ships'] = [ship.to_dict() for ship in Ship.objects.filter(category_id__isnull=True).order_by('id')]
         cat_dict['is_leaf'] = True
 
         return  JSONResponse(cat_dict)
 
     def get(self, request, category_id=None):
+        if dataset.is_enabled():
+            return JSONResponse(dataset.get_dataset().get_category_details(category_id))
+
         if category_id == '0' or category_id is None:
             return self._get_uncategorized_ships()
         return self._get_ships(category_id)
+
+
+class AssetView(View):
+    """
+    serves model and texture files with their precompressed sidecars.
+
+    the sidecar is picked from Accept-Encoding, Range requests are answered
+    from the uncompressed file. responses are marked so the GZip middleware
+    leaves them alone.
+    """
+
+    RANGE_RX = re.compile(r'^bytes=(\d*)-(\d*)$')
+    HASHED_RX = re.compile(r'^[0-9a-f]{40}\.(dat|tex)$')
+
+    # preferred first
+    ENCODINGS = ['br', 'gzip']
+
+    def get(self, request, path, *args, **kwargs):
+        filename = os.path.join(settings.BASE_DIR, 'static', path)
+        if not os.path.isfile(filename):
+            raise Http404('{} not found'.format(path))
+
+        stat = os.stat(filename)
+        etag = '"{:x}-{:x}"'.format(stat.st_size, int(stat.st_mtime * 1000000))
+
+        sidecars = self._get_sidecars(request, filename)
+
+        # a cached sidecar response is validated with its own etag
+        valid_etags = [etag] + [self._get_encoded_etag(etag, encoding) for encoding, _ in sidecars]
+        if_none_match = [candidate.strip() for candidate in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]
+        matched = [candidate for candidate in valid_etags if candidate in if_none_match]
+        if matched or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = matched[0] if matched else etag
+            return self._finish(response, path)
+
+        byte_range = self._get_range(request, stat.st_size, etag)
+        if byte_range is not None:
+            response = self._get_partial(filename, stat.st_size, byte_range)
+        else:
+            response = self._get_full(filename, etag, sidecars)
+
+        response['ETag'] = response.get('ETag', etag)
+        return self._finish(response, path)
+
+    def _finish(self, response, path):
+        if self.HASHED_RX.match(os.path.basename(path)):
+            # content addressed, the file behind this name never changes
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+
+        response['Accept-Ranges'] = 'bytes'
+        response['Vary'] = 'Accept-Encoding'
+        response.skip_gzip = True
+        return response
+
+    def _get_sidecars(self, request, filename):
+        """ (encoding, path) of every existing sidecar the client accepts, preferred first """
+        accepted = self._get_accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        sidecar_paths = get_sidecar_paths(filename)
+
+        return [
+            (encoding, sidecar_paths[encoding]) for encoding in self.ENCODINGS
+            if encoding in accepted and encoding in sidecar_paths and os.path.isfile(sidecar_paths[encoding])
+        ]
+
+    @staticmethod
+    def _get_encoded_etag(etag, encoding):
+        # every representation needs its own strong validator
+        return '{}-{}"'.format(etag[:-1], encoding)
+
+    def _get_full(self, filename, etag, sidecars):
+        if sidecars:
+            encoding, sidecar_path = sidecars[0]
+            response = FileResponse(open(sidecar_path, 'rb'), content_type='application/octet-stream')
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = os.path.getsize(sidecar_path)
+            response['ETag'] = self._get_encoded_etag(etag, encoding)
+            return response
+
+        response = FileResponse(open(filename, 'rb'), content_type='application/octet-stream')
+        response['Content-Length'] = os.path.getsize(filename)
+        return response
+
+    @staticmethod
+    def _get_partial(filename, size, byte_range):
+        start, end = byte_range
+        if start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+        def read_range():
+            with open(filename, 'rb') as file:
+                file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = file.read(min(remaining, COPY_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        response = StreamingHttpResponse(read_range(), status=206, content_type='application/octet-stream')
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        response['Content-Length'] = end - start + 1
+        return response
+
+    def _get_range(self, request, size, etag):
+        """ (first, last) byte of a single range request, None to send the whole file """
+        match = self.RANGE_RX.match(request.META.get('HTTP_RANGE', '').strip())
+        if not match or not any(match.groups()):
+            return None
+
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range.strip() != etag:
+            return None
+
+        first, last = match.groups()
+        if not first:
+            # suffix range, the last n bytes
+            return max(size - int(last), 0), size - 1
+
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+        if first < size and first > last:
+            return None
+
+        # a first byte behind the end is answered with 416
+        return first, last
+
+    @staticmethod
+    def _get_accepted_encodings(accept_encoding):
+        accepted = set()
+        for part in accept_encoding.split(','):
+            coding, _, params = part.strip().partition(';')
+            quality = params.strip().replace(' ', '')
+            if quality.startswith('q='):
+                try:
+                    if float(quality[2:] or 0) == 0:
+                        continue
+                except ValueError:
+                    # malformed q-value, ignore the entry
+                    continue
+            accepted.add(coding.strip().lower())
+        return accepted
+
@@ -38,7 +38,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.middleware.gzip.GZipMiddleware',
+    'api.middleware.GZipMiddleware',
 ]
 
 ROOT_URLCONF = 'flmatrix.urls'
@@ -121,6 +121,9 @@ else:
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# API responses are cached per data version, see api/cache.py for the settings.
+# local.py can set CACHES and API_CACHE_ALIAS, e.g. a FileBasedCache shared by all workers.
+
 STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
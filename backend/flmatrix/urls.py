@@ -20,9 +20,15 @@ from django.conf.urls.static import static
 
 from django.views.generic import TemplateView
 
+from api.views import AssetView
+
 prefix = settings.FL_PATH_PREFIX[1:]
 
-urlpatterns = static(settings.INTERNAL_STATIC_URL, document_root=settings.STATIC_ROOT)
+# model and texture files, with precompressed variants and range support
+urlpatterns = [
+    url(r'^{}(?P<path>(?:models|textures)/[\w.]+\.(?:dat|tex))$'.format(settings.INTERNAL_STATIC_URL[1:]), AssetView.as_view()),
+]
+urlpatterns += static(settings.INTERNAL_STATIC_URL, document_root=settings.STATIC_ROOT)
 urlpatterns += [
     url(r'^admin/', admin.site.urls),
     url(r'^api/', include('api.urls')),
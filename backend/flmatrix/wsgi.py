@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "flmatrix.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if getattr(settings, 'API_IN_MEMORY_DATASET', False):
+    from api.dataset import get_dataset
+    get_dataset()
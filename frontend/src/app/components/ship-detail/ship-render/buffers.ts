@@ -1,11 +1,13 @@
 import { RenderConstants } from './constants';
 import { GL } from './gl';
-import { ShipModel } from './../../../services/ship-model';
+import { ShipModel, VERTEX_STRIDE } from './../../../services/ship-model';
+
+const FLOAT_SIZE = Float32Array.BYTES_PER_ELEMENT;
+
 export class Buffers {
     private vertexBuffers: WebGLBuffer[];
-    private normalBuffers: WebGLBuffer[];
     private indexBuffers: WebGLBuffer[];
-    private uvBuffers: WebGLBuffer[];
+    private indexTypes: number[];
     private boundingVertexBuffer: WebGLBuffer;
     private boundingIndexBuffer: WebGLBuffer;
 
@@ -14,28 +16,32 @@ export class Buffers {
     constructor(private model: ShipModel) {
         this.indexBuffers = [];
         this.vertexBuffers = [];
-        this.normalBuffers = [];
-        this.uvBuffers = [];
+        this.indexTypes = [];
 
         this.createBuffers();
     }
 
     bind(index: number) {
+        const stride = VERTEX_STRIDE * FLOAT_SIZE;
+
+        // position, normal and uv are interleaved in one buffer
         GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, this.vertexBuffers[index]);
-        GL.gl.vertexAttribPointer(RenderConstants.aVertexPosition, 3, GL.gl.FLOAT, false, 0, 0);
+        GL.gl.vertexAttribPointer(RenderConstants.aVertexPosition, 3, GL.gl.FLOAT, false, stride, 0);
         GL.gl.enableVertexAttribArray(RenderConstants.aVertexPosition);
 
-        GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, this.normalBuffers[index]);
-        GL.gl.vertexAttribPointer(RenderConstants.aVertexNormal, 3, GL.gl.FLOAT, false, 0, 0);
+        GL.gl.vertexAttribPointer(RenderConstants.aVertexNormal, 3, GL.gl.FLOAT, false, stride, 3 * FLOAT_SIZE);
         GL.gl.enableVertexAttribArray(RenderConstants.aVertexNormal);
 
-        GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, this.uvBuffers[index]);
-        GL.gl.vertexAttribPointer(RenderConstants.aTextureCoord, 2, GL.gl.FLOAT, false, 0, 0);
+        GL.gl.vertexAttribPointer(RenderConstants.aTextureCoord, 2, GL.gl.FLOAT, false, stride, 6 * FLOAT_SIZE);
         GL.gl.enableVertexAttribArray(RenderConstants.aTextureCoord);
 
         GL.gl.bindBuffer(GL.gl.ELEMENT_ARRAY_BUFFER, this.indexBuffers[index]);
     }
 
+    getIndexType(index: number) {
+        return this.indexTypes[index];
+    }
+
     bindBounding() {
         GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, this.boundingVertexBuffer);
         GL.gl.vertexAttribPointer(RenderConstants.aVertexPosition, 3, GL.gl.FLOAT, false, 0, 0);
@@ -53,49 +59,31 @@ export class Buffers {
         for (const buffer of this.indexBuffers) {
             GL.gl.deleteBuffer(buffer);
         }
-        for (const buffer of this.normalBuffers) {
-            GL.gl.deleteBuffer(buffer);
-        }
-        for (const buffer of this.uvBuffers) {
-            GL.gl.deleteBuffer(buffer);
-        }
         GL.gl.deleteBuffer(this.boundingVertexBuffer);
         GL.gl.deleteBuffer(this.boundingIndexBuffer);
 
         this.indexBuffers = [];
         this.vertexBuffers = [];
-        this.normalBuffers = [];
-        this.uvBuffers = [];
+        this.indexTypes = [];
     }
 
     private createBuffers() {
-        for (let i = 0; i < this.model.numMeshes; i++) {
-            const vertices = this.model.vertexBuffer[i];
-            const uvs = this.model.uvBuffer[i];
-            const normals = this.flattenNormals(this.model.normalBuffer[i]);
-
-            const vertexCount = vertices.length / 3;
-            const indices = this.getIndexArray(vertexCount);
-
+        for (const mesh of this.model.meshes) {
             const vertexBuffer = GL.gl.createBuffer();
             GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, vertexBuffer);
-            GL.gl.bufferData(GL.gl.ARRAY_BUFFER, vertices, GL.gl.STATIC_DRAW);
+            GL.gl.bufferData(GL.gl.ARRAY_BUFFER, mesh.vertices, GL.gl.STATIC_DRAW);
             this.vertexBuffers.push(vertexBuffer);
 
-            const uvBuffer = GL.gl.createBuffer();
-            GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, uvBuffer);
-            GL.gl.bufferData(GL.gl.ARRAY_BUFFER, uvs, GL.gl.STATIC_DRAW);
-            this.uvBuffers.push(uvBuffer);
-
-            const normalBuffer = GL.gl.createBuffer();
-            GL.gl.bindBuffer(GL.gl.ARRAY_BUFFER, normalBuffer);
-            GL.gl.bufferData(GL.gl.ARRAY_BUFFER, normals, GL.gl.STATIC_DRAW);
-            this.normalBuffers.push(normalBuffer);
+            // meshes above 65536 vertices come with 32 bit indices, which WebGL 1 only draws with the extension
+            if (mesh.indices instanceof Uint32Array) {
+                GL.gl.getExtension('OES_element_index_uint');
+            }
 
             const indexBuffer = GL.gl.createBuffer();
             GL.gl.bindBuffer(GL.gl.ELEMENT_ARRAY_BUFFER, indexBuffer);
-            GL.gl.bufferData(GL.gl.ELEMENT_ARRAY_BUFFER, indices, GL.gl.STATIC_DRAW);
+            GL.gl.bufferData(GL.gl.ELEMENT_ARRAY_BUFFER, mesh.indices, GL.gl.STATIC_DRAW);
             this.indexBuffers.push(indexBuffer);
+            this.indexTypes.push(mesh.indices instanceof Uint32Array ? GL.gl.UNSIGNED_INT : GL.gl.UNSIGNED_SHORT);
         }
 
         this.createBoundingBuffer();
@@ -146,18 +134,6 @@ export class Buffers {
         GL.gl.bindBuffer(GL.gl.ELEMENT_ARRAY_BUFFER, null);
     }
 
-    private flattenNormals(normals: Float32Array[]) {
-        const output = new Float32Array(normals.length * 3);
-
-        for (let i = 0; i < normals.length; i++) {
-            output[i * 3] = normals[i][0];
-            output[i * 3 + 1] = normals[i][1];
-            output[i * 3 + 2] = normals[i][2];
-        }
-
-        return output;
-    }
-
     private getIndexArray(length: number) {
         const arr = new Uint16Array(length);
         for (let x = 0; x < arr.length; x++) {
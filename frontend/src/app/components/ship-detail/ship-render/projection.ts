@@ -3,6 +3,7 @@ import { RenderConstants } from './constants';
 import { GL } from './gl';
 import { mat4, vec3 } from 'gl-matrix';
 import { EventEmitter } from '@angular/core';
+import { VERTEX_STRIDE } from './../../../services/ship-model';
 
 export interface BoundingBox {
     min: [number, number, number];
@@ -102,10 +103,11 @@ export class Projection {
         let [minX, minY, minZ] = [Infinity, Infinity, Infinity];
 
         for (const mesh of vertices) {
-            for (let i = 0; i < mesh.length / 3; i++) {
-                const x = mesh[i * 3];
-                const y = mesh[i * 3 + 1];
-                const z = mesh[i * 3 + 2];
+            // interleaved vertices, the position comes first
+            for (let i = 0; i < mesh.length; i += VERTEX_STRIDE) {
+                const x = mesh[i];
+                const y = mesh[i + 1];
+                const z = mesh[i + 2];
 
                 maxX = Math.max(maxX, x);
                 maxY = Math.max(maxY, y);
@@ -162,7 +162,7 @@ export class Renderer {
         GL.gl.clear(GL.gl.COLOR_BUFFER_BIT);
 
         for (let i = 0; i < this._model.numMeshes; i++) {
-            const vertexCount = this._model.vertexBuffer[i].length / 3;
+            const indexCount = this._model.meshes[i].indices.length;
 
             this.buffers.bind(i);
 
@@ -171,7 +171,7 @@ export class Renderer {
             }
 
             this.useProgram.use(i, this.projection);
-            GL.gl.drawElements(GL.gl.TRIANGLES, vertexCount, GL.gl.UNSIGNED_SHORT, 0);
+            GL.gl.drawElements(GL.gl.TRIANGLES, indexCount, this.buffers.getIndexType(i), 0);
 
             if (this._settings.boundingBox) {
                 this.buffers.bindBounding();
@@ -248,6 +248,6 @@ export class Renderer {
         this.lineProgram = new LineProgram(this.staticServ, {dashed: true});
         this.buffers = new Buffers(this._model);
 
-        this.projection.boundingBox = this._model.vertexBuffer;
+        this.projection.boundingBox = this._model.meshes.map(mesh => mesh.vertices);
     }
 }
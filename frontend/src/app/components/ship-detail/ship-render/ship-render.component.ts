@@ -57,12 +57,28 @@ export class ShipRenderComponent implements OnChanges, DoCheck, OnDestroy {
         this.initRender();
 
         this.selectedLOD = this.settings.selectedLOD;
-        this.shipDetais.getModel(this.ship, this.selectedLOD).subscribe((model: ShipModel) => {
-            model.id = this.ship.id;
-            model.lod = this.selectedLOD;
+
+        // a new ship shows its lightest LOD until the selected one is loaded
+        const lightestLOD = this.ship.lods.slice().sort((a, b) => a.localeCompare(b, undefined, {numeric: true})).pop();
+        if (changes.ship && lightestLOD !== this.selectedLOD) {
+            this.loadModel(lightestLOD);
+        }
+        this.loadModel(this.selectedLOD);
+    }
+
+    loadModel(lod: string) {
+        const ship = this.ship;
+        this.shipDetais.getModel(ship, lod).subscribe((model: ShipModel) => {
+            const isCurrent = this.model && this.model.id === ship.id && this.model.lod === this.selectedLOD;
+            if (ship !== this.ship || isCurrent) {
+                return;
+            }
+
+            model.id = ship.id;
+            model.lod = lod;
 
             this.model = model;
-            this.renderer.setModel(this.ship, this.model);
+            this.renderer.setModel(ship, this.model);
         });
     }
 
@@ -1,11 +1,14 @@
 import { Index, ShipDetails, Dictionary } from './../../../services/interfaces';
 import { RenderConstants } from './constants';
-import { ShipTexture, ShipTexturePack } from './../../../services/ship-texture';
+import { ShipTexture, ShipTexturePack, TextureLevel } from './../../../services/ship-texture';
 import { TextureService } from './../../../services/services';
 import { ShipModel } from './../../../services/ship-model';
 import { Program } from './program';
 import { GL } from './gl';
 
+// longest side of the texture variant loaded before the full texture
+const PREVIEW_SIZE = 256;
+
 export class Textures {
     private textures: Index<Dictionary<WebGLTexture>>;
     private diffuseIndex: Index<number[]>;
@@ -94,7 +97,16 @@ export class Textures {
                 this.createEmptyTexture(texId, new Uint8Array([0, 0, 0, 255]), 'light');
             }
 
+            // a small variant shows up first, unless the full texture is faster
+            let fullLoaded = false;
+            this.textureService.getTextureVariant(this.ship, texId, PREVIEW_SIZE).subscribe((preview: ShipTexture) => {
+                if (!fullLoaded) {
+                    this.loadTexture(texId, preview);
+                }
+            }, (error: Error) => console.error('error loading texture preview:', texId, error.message));
+
             this.textureService.getTexture(this.ship, texId).subscribe((data: ShipTexturePack) => {
+                fullLoaded = true;
                 this.loadTexture(texId, data.base);
                 if (data.meta && data.meta.diffuse_color) {
                     this.diffuseIndex[texId] = data.meta.diffuse_color;
@@ -161,27 +173,50 @@ export class Textures {
         GL.gl.bindTexture(GL.gl.TEXTURE_2D, tex);
         GL.gl.pixelStorei(GL.gl.UNPACK_FLIP_Y_WEBGL, data.inversion);
 
-        GL.gl.texImage2D(
-            GL.gl.TEXTURE_2D,       // target
-            0,                      // level
-            GL.gl.RGBA,             // internalFormat: RGBA
-            data.width,             // width
-            data.height,            // height
-            0,                      // border
-            GL.gl.RGBA,             // format (must be same as internalFormat)
-            GL.gl.UNSIGNED_BYTE,    // type (same as internal)
-            data.rgbMatrix,         // pixels (...finally)
-        );
+        // DXT blocks go to the GPU as they are, without the extension they are decoded to RGBA
+        const s3tc = data.compressed ? GL.gl.getExtension('WEBGL_compressed_texture_s3tc') : null;
+        data.levels.forEach((level: TextureLevel, index: number) => {
+            if (s3tc) {
+                GL.gl.compressedTexImage2D(
+                    GL.gl.TEXTURE_2D,
+                    index,
+                    data.format === 'dxt1' ? s3tc.COMPRESSED_RGB_S3TC_DXT1_EXT : s3tc.COMPRESSED_RGBA_S3TC_DXT5_EXT,
+                    level.width,
+                    level.height,
+                    0,
+                    level.data,
+                );
+            } else {
+                GL.gl.texImage2D(
+                    GL.gl.TEXTURE_2D,       // target
+                    index,                  // level
+                    GL.gl.RGBA,             // internalFormat: RGBA
+                    level.width,            // width
+                    level.height,           // height
+                    0,                      // border
+                    GL.gl.RGBA,             // format (must be same as internalFormat)
+                    GL.gl.UNSIGNED_BYTE,    // type (same as internal)
+                    data.getPixels(level),  // pixels (...finally)
+                );
+            }
+        });
 
         GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_MAG_FILTER, GL.gl.LINEAR);
         GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_MIN_FILTER, GL.gl.LINEAR_MIPMAP_NEAREST);
 
-        if (this.isPowerOf2(data.width)) {
+        if (data.levels.length > 1) {
+            // the file brings its mip chain
+            GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_MIN_FILTER, GL.gl.LINEAR_MIPMAP_LINEAR);
+        } else if (this.isPowerOf2(data.width) && !s3tc) {
             GL.gl.generateMipmap(GL.gl.TEXTURE_2D);
         } else {
-            GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_WRAP_S, GL.gl.CLAMP_TO_EDGE);
-            GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_WRAP_T, GL.gl.CLAMP_TO_EDGE);
+            // mipmaps can not be generated for compressed textures
             GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_MIN_FILTER, GL.gl.LINEAR);
+
+            if (!this.isPowerOf2(data.width)) {
+                GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_WRAP_S, GL.gl.CLAMP_TO_EDGE);
+                GL.gl.texParameteri(GL.gl.TEXTURE_2D, GL.gl.TEXTURE_WRAP_T, GL.gl.CLAMP_TO_EDGE);
+            }
         }
         GL.gl.bindTexture(GL.gl.TEXTURE_2D, null);
 
@@ -28,6 +28,9 @@ export interface TextureInfo {
     light_path: string;
     bump_path: string;
     meta_path: string;
+
+    // size capped variants by their longest side
+    variants: Dictionary<string>;
 }
 
 export interface TextureMeta {
@@ -61,6 +64,11 @@ export interface ShipDetails extends ShipListEntry {
     texture_info: Dictionary<TextureInfo>;
 }
 
+export interface ShipQueryPage {
+    results: ShipDetails[];
+    next: string;
+}
+
 export interface CategoryDetail extends Category {
     is_leaf: boolean;
     ships: ShipListEntry[];
@@ -2,6 +2,7 @@ import { ShipTexture, ShipTexturePack } from './ship-texture';
 import {
     ShipDetails,
     ShipListEntry,
+    ShipQueryPage,
     Category,
     CategoryTree,
     CategoryDetail,
@@ -13,6 +14,7 @@ import { Http, Response, RequestOptions, ResponseContentType } from '@angular/ht
 import { Observable } from 'rxjs/Observable';
 import 'rxjs/add/operator/map';
 import 'rxjs/add/observable/of';
+import 'rxjs/add/observable/empty';
 import 'rxjs/add/observable/throw';
 import 'rxjs/add/observable/forkJoin';
 
@@ -28,6 +30,21 @@ export class ShipDetailService {
         return this.http.get(`${Constants.getPrefix()}api/ships/${shipId}`).map((res: Response) => res.json());
     }
 
+    getShipsDetails(shipIds: number[], fields?: string[]): Observable<ShipDetails[]> {
+        let url = `${Constants.getPrefix()}api/ships?ids=${shipIds.join(',')}`;
+        if (fields) {
+            url += `&fields=${fields.join(',')}`;
+        }
+        return this.http.get(url).map((res: Response) => res.json());
+    }
+
+    queryShips(params: Dictionary<string>): Observable<ShipQueryPage> {
+        const query = Object.keys(params).map(
+            (key: string) => `${encodeURIComponent(key)}=${encodeURIComponent(params[key])}`,
+        ).join('&');
+        return this.http.get(`${Constants.getPrefix()}api/ships/query?${query}`).map((res: Response) => res.json());
+    }
+
     getModel(ship: ShipDetails, lodName: string): Observable<ShipModel> {
         const options = {responseType: ResponseContentType.ArrayBuffer};
         return this.http.get(ship.static_model_paths[lodName], options).map(
@@ -72,6 +89,24 @@ export class StaticService {
 export class TextureService {
     constructor(private http: Http) {}
 
+    getTextureVariant(ship: ShipDetails, texId: number, maxSize: number): Observable<ShipTexture> {
+        // the largest size capped variant within maxSize, nothing if the texture has none
+        const info = ship.texture_info[texId];
+        const sizes = Object.keys(info && info.variants || {})
+            .map(size => parseInt(size, 10))
+            .filter(size => size <= maxSize)
+            .sort((a, b) => b - a);
+
+        if (!sizes.length) {
+            return Observable.empty();
+        }
+
+        const options = {responseType: ResponseContentType.ArrayBuffer};
+        return this.http.get(info.variants[sizes[0]], options).map(
+            (res: Response) => new ShipTexture(res.arrayBuffer()),
+        );
+    }
+
     getTexture(ship: ShipDetails, texId: number): Observable<ShipTexturePack> {
         const options = {responseType: ResponseContentType.ArrayBuffer};
         if (ship.texture_info[texId]) {
@@ -1,16 +1,130 @@
+// floats per vertex: position xyz, normal xyz, uv
+export const VERTEX_STRIDE = 8;
+
+const MESH_MAGIC = 'FLMS';
+const MESH_HEADER_SIZE = 8;
+const MESH_ENTRY_SIZE = 16;
+const MESH_QUANTIZATION_SIZE = 24;
+
+// header flags
+const MESH_QUANTIZED = 1;
+
+// int16 position xyz, int16 octahedral normal xy, float16 uv
+const QUANTIZED_VERTEX_SIZE = 14;
+const INT16_MAX = 32767;
+
+export interface ShipMesh {
+    vertices: Float32Array;
+    indices: Uint16Array | Uint32Array;
+}
 
 export class ShipModel {
     public numMeshes: number;
 
-    public vertexBuffer: any;
-    public normalBuffer: any;
-    public uvBuffer: any;
-    public matBuffer: any;
+    public meshes: ShipMesh[];
+    public matBuffer: Uint32Array;
     public id: number;
     public lod: string;
 
     constructor(shipData: ArrayBuffer) {
-        this.parseData(shipData);
+        if (this.isMeshFile(shipData)) {
+            this.parseMeshData(shipData);
+        } else {
+            this.parseData(shipData);
+        }
+    }
+
+    private isMeshFile(buffer: ArrayBuffer) {
+        if (buffer.byteLength < MESH_HEADER_SIZE) {
+            return false;
+        }
+        return String.fromCharCode.apply(null, new Uint8Array(buffer, 0, 4)) === MESH_MAGIC;
+    }
+
+    private parseMeshData(buffer: ArrayBuffer) {
+        const view = new DataView(buffer);
+        const quantized = (view.getUint8(5) & MESH_QUANTIZED) !== 0;
+        const entrySize = MESH_ENTRY_SIZE + (quantized ? MESH_QUANTIZATION_SIZE : 0);
+        this.numMeshes = view.getUint16(6, true);
+
+        this.meshes = [];
+        this.matBuffer = new Uint32Array(this.numMeshes);
+        for (let i = 0; i < this.numMeshes; i++) {
+            const entry = MESH_HEADER_SIZE + i * entrySize;
+            const vertexCount = view.getUint32(entry + 4, true);
+            const indexCount = view.getUint32(entry + 8, true);
+            const offset = view.getUint32(entry + 12, true);
+
+            let vertices: Float32Array;
+            let vertexSize: number;
+            if (quantized) {
+                vertices = this.dequantize(view, entry + MESH_ENTRY_SIZE, offset, vertexCount);
+                vertexSize = QUANTIZED_VERTEX_SIZE;
+            } else {
+                vertices = new Float32Array(buffer, offset, vertexCount * VERTEX_STRIDE);
+                vertexSize = VERTEX_STRIDE * Float32Array.BYTES_PER_ELEMENT;
+            }
+
+            // indices start 4 byte aligned behind the vertices
+            const indexOffset = offset + Math.ceil(vertexCount * vertexSize / 4) * 4;
+            this.matBuffer[i] = view.getUint32(entry, true);
+            this.meshes.push({
+                vertices: vertices,
+                indices: vertexCount <= 0x10000 ?
+                    new Uint16Array(buffer, indexOffset, indexCount) :
+                    new Uint32Array(buffer, indexOffset, indexCount),
+            });
+        }
+    }
+
+    private dequantize(view: DataView, params: number, offset: number, vertexCount: number) {
+        const origin = [0, 1, 2].map(axis => view.getFloat32(params + axis * 4, true));
+        const step = [0, 1, 2].map(axis => view.getFloat32(params + 12 + axis * 4, true));
+        const data = new Float32Array(vertexCount * VERTEX_STRIDE);
+
+        for (let i = 0; i < vertexCount; i++) {
+            const source = offset + i * QUANTIZED_VERTEX_SIZE;
+            const base = i * VERTEX_STRIDE;
+
+            for (let axis = 0; axis < 3; axis++) {
+                data[base + axis] = origin[axis] + view.getInt16(source + axis * 2, true) * step[axis];
+            }
+
+            this.decodeOctahedral(
+                view.getInt16(source + 6, true) / INT16_MAX, view.getInt16(source + 8, true) / INT16_MAX, data, base + 3,
+            );
+
+            data[base + 6] = this.halfToFloat(view.getUint16(source + 10, true));
+            data[base + 7] = this.halfToFloat(view.getUint16(source + 12, true));
+        }
+
+        return data;
+    }
+
+    private decodeOctahedral(x: number, y: number, target: Float32Array, offset: number) {
+        const z = 1 - Math.abs(x) - Math.abs(y);
+        if (z < 0) {
+            [x, y] = [(1 - Math.abs(y)) * (x >= 0 ? 1 : -1), (1 - Math.abs(x)) * (y >= 0 ? 1 : -1)];
+        }
+
+        const length = Math.sqrt(x * x + y * y + z * z);
+        target[offset] = x / length;
+        target[offset + 1] = y / length;
+        target[offset + 2] = z / length;
+    }
+
+    private halfToFloat(half: number) {
+        const sign = half & 0x8000 ? -1 : 1;
+        const exponent = (half >> 10) & 0x1f;
+        const fraction = half & 0x3ff;
+
+        if (exponent === 0) {
+            return sign * Math.pow(2, -14) * (fraction / 1024);
+        }
+        if (exponent === 0x1f) {
+            return fraction ? NaN : sign * Infinity;
+        }
+        return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
     }
 
     private parseData(buffer: ArrayBuffer) {
@@ -27,13 +141,13 @@ export class ShipModel {
 
         this.numMeshes =  new Uint32Array(buffer, offset, 1)[0];
 
-        this.readVerices(buffer, offset, offset + vertLen);
+        const vertexBuffer = this.readVerices(buffer, offset, offset + vertLen);
         offset += vertLen;
 
-        this.readNormals(buffer, offset, offset + normLen);
+        const normalBuffer = this.readNormals(buffer, offset, offset + normLen);
         offset += normLen;
 
-        this.readUVs(buffer, offset, offset + uvLen);
+        const uvBuffer = this.readUVs(buffer, offset, offset + uvLen);
         offset += uvLen;
 
         this.readMats(buffer, offset, matLen);
@@ -42,18 +156,40 @@ export class ShipModel {
         if (offset !== buffer.byteLength) {
             console.error(`total length missmatch! ${offset} should be at ${buffer.byteLength}`);
         }
+
+        this.meshes = [];
+        for (let i = 0; i < this.numMeshes; i++) {
+            this.meshes.push(this.interleave(vertexBuffer[i], normalBuffer[i], uvBuffer[i]));
+        }
+    }
+
+    private interleave(vertices: Float32Array, normals: Float32Array[], uvs: Float32Array): ShipMesh {
+        // the legacy format is an unindexed triangle soup, every vertex is used once
+        const vertexCount = vertices.length / 3;
+        const data = new Float32Array(vertexCount * VERTEX_STRIDE);
+        const indices = vertexCount <= 0x10000 ? new Uint16Array(vertexCount) : new Uint32Array(vertexCount);
+
+        for (let i = 0; i < vertexCount; i++) {
+            const base = i * VERTEX_STRIDE;
+            data.set(vertices.subarray(i * 3, i * 3 + 3), base);
+            data.set(normals[i], base + 3);
+            data.set(uvs.subarray(i * 2, i * 2 + 2), base + 6);
+            indices[i] = i;
+        }
+
+        return {vertices: data, indices: indices};
     }
 
     private readVerices(buffer: ArrayBuffer, offset: number, should: number) {
         const numMeshes = new Uint32Array(buffer, offset, 1)[0];
         offset += Uint32Array.BYTES_PER_ELEMENT;
 
-        this.vertexBuffer = [];
+        const vertexBuffer = [];
         for (let i = 0; i < numMeshes; i++) {
             const vertLen = new Uint32Array(buffer, offset, 1)[0];
             offset += Uint32Array.BYTES_PER_ELEMENT;
 
-            this.vertexBuffer.push(
+            vertexBuffer.push(
                 new Float32Array(buffer, offset, vertLen),
             );
 
@@ -63,19 +199,20 @@ export class ShipModel {
         if (offset !== should) {
             console.error(`vertex length missmatch! ${offset} should be at ${should}`);
         }
+        return vertexBuffer;
     }
     private readNormals(buffer: ArrayBuffer, offset: number, should: number) {
         const numMeshes = new Uint32Array(buffer, offset, 1)[0];
         offset += Uint32Array.BYTES_PER_ELEMENT;
 
-        this.normalBuffer = [];
+        const normalBuffer = [];
         for (let i = 0; i < numMeshes; i++) {
             const normLen = new Uint32Array(buffer, offset, 1)[0];
             offset += Uint32Array.BYTES_PER_ELEMENT;
 
-            this.normalBuffer[i] = [];
+            normalBuffer[i] = [];
             for (let j = 0; j < normLen; j++) {
-                this.normalBuffer[i].push(
+                normalBuffer[i].push(
                     new Float32Array(buffer, offset, 3),
                 )
                 offset += Float32Array.BYTES_PER_ELEMENT * 3;
@@ -85,17 +222,18 @@ export class ShipModel {
         if (offset !== should) {
             console.error(`normals length missmatch! ${offset} should be at ${should}`);
         }
+        return normalBuffer;
     }
     private readUVs(buffer: ArrayBuffer, offset: number, should: number) {
         const numMeshes = new Uint32Array(buffer, offset, 1)[0];
         offset += Uint32Array.BYTES_PER_ELEMENT;
 
-        this.uvBuffer = [];
+        const uvBuffer = [];
         for (let i = 0; i < numMeshes; i++) {
             const uvLen = new Uint32Array(buffer, offset, 1)[0];
             offset += Uint32Array.BYTES_PER_ELEMENT;
 
-            this.uvBuffer.push(
+            uvBuffer.push(
                 new Float32Array(buffer, offset, uvLen),
             );
 
@@ -105,6 +243,7 @@ export class ShipModel {
         if (offset !== should) {
             console.error(`UV length missmatch! ${offset} should be at ${should}`);
         }
+        return uvBuffer;
     }
     private readMats(buffer: ArrayBuffer, offset: number, length: number) {
         this.matBuffer = new Uint32Array(buffer, offset, length / 4);
@@ -1,18 +1,82 @@
 import { TextureMeta } from './interfaces';
 
+const TEXTURE_MAGIC = 'FLTX';
+const TEXTURE_HEADER_SIZE = 16;
+const TEXTURE_FORMATS = ['rgba', 'dxt1', 'dxt5'];
+
+// header flags
+const TEXTURE_INVERTED = 1;
+
+export interface TextureLevel {
+    width: number;
+    height: number;
+    data: Uint8Array;
+}
+
 export class ShipTexture {
-    public rgbMatrix: Uint8Array;
+    public format: string;
+
+    // RGBA8 pixels or DXT blocks of the largest level, depending on the format
+    public data: Uint8Array;
     public width: number;
     public height: number;
     public inversion: boolean;
 
+    // mip chain, largest first
+    public levels: TextureLevel[];
+
     constructor(textureData: ArrayBuffer) {
-        this.parseData(textureData);
+        if (this.isTaggedFile(textureData)) {
+            this.parseTaggedData(textureData);
+        } else {
+            this.parseData(textureData);
+        }
+    }
+
+    get compressed() {
+        return this.format !== 'rgba';
+    }
+
+    get rgbMatrix(): Uint8Array {
+        return this.getPixels(this.levels[0]);
+    }
+
+    getPixels(level: TextureLevel): Uint8Array {
+        return this.compressed ? this.decodeBlocks(level) : level.data;
+    }
+
+    private isTaggedFile(buffer: ArrayBuffer) {
+        if (buffer.byteLength < TEXTURE_HEADER_SIZE) {
+            return false;
+        }
+        return String.fromCharCode.apply(null, new Uint8Array(buffer, 0, 4)) === TEXTURE_MAGIC;
+    }
+
+    private parseTaggedData(buffer: ArrayBuffer) {
+        const view = new DataView(buffer);
+
+        this.format = TEXTURE_FORMATS[view.getUint8(5)];
+        this.inversion = (view.getUint8(6) & TEXTURE_INVERTED) !== 0;
+        this.width = view.getUint32(8, true);
+        this.height = view.getUint32(12, true);
+
+        this.levels = [];
+        let [width, height, offset] = [this.width, this.height, TEXTURE_HEADER_SIZE];
+        for (let i = 0; i < view.getUint8(7); i++) {
+            const data = new Uint8Array(buffer, offset, this.getDataLength(width, height));
+            this.levels.push({width: width, height: height, data: data});
+
+            offset += data.length;
+            width = Math.max(1, width >> 1);
+            height = Math.max(1, height >> 1);
+        }
+        this.data = this.levels[0].data;
     }
 
     private parseData(buffer: ArrayBuffer) {
         let offset = 0;
 
+        this.format = 'rgba';
         this.width = new Uint32Array(buffer, offset, 1)[0];
         offset += Uint32Array.BYTES_PER_ELEMENT;
         this.height = new Uint32Array(buffer, offset, 1)[0];
@@ -21,10 +85,116 @@ export class ShipTexture {
         this.inversion = new Uint8Array(buffer, offset, 1)[0] === 1;
         offset += Uint8Array.BYTES_PER_ELEMENT;
 
-        // width * height * channel count (RGBA = 4)
-        const matrixLength = this.width * this.height * 4;
-        this.rgbMatrix = new Uint8Array(buffer, offset, matrixLength);
-        offset += matrixLength;
+        this.data = new Uint8Array(buffer, offset, this.getDataLength(this.width, this.height));
+        offset += this.data.length;
+
+        this.levels = [{width: this.width, height: this.height, data: this.data}];
+    }
+
+    private getDataLength(width: number, height: number) {
+        if (!this.compressed) {
+            // width * height * channel count (RGBA = 4)
+            return width * height * 4;
+        }
+
+        // 4x4 pixel blocks of 8 (DXT1) or 16 (DXT5) bytes
+        const blockSize = this.format === 'dxt1' ? 8 : 16;
+        return Math.ceil(width / 4) * Math.ceil(height / 4) * blockSize;
+    }
+
+    private decodeBlocks(level: TextureLevel) {
+        // only needed without WEBGL_compressed_texture_s3tc
+        const [width, height, data] = [level.width, level.height, level.data];
+        const pixels = new Uint8Array(width * height * 4);
+        const blockSize = this.format === 'dxt1' ? 8 : 16;
+        const blocksPerRow = Math.ceil(width / 4);
+        const palette = new Uint8Array(16);
+        const alphas = new Uint8Array(8);
+
+        for (let block = 0; block * blockSize < data.length; block++) {
+            const offset = block * blockSize;
+            const colorOffset = blockSize === 16 ? offset + 8 : offset;
+
+            this.getColorPalette(data, colorOffset, palette, blockSize === 8);
+            if (blockSize === 16) {
+                this.getAlphaPalette(data, offset, alphas);
+            }
+
+            const bx = (block % blocksPerRow) * 4;
+            const by = Math.floor(block / blocksPerRow) * 4;
+            for (let i = 0; i < 16; i++) {
+                const x = bx + i % 4;
+                const y = by + Math.floor(i / 4);
+                if (x >= width || y >= height) {
+                    continue;
+                }
+
+                const colorIndex = (data[colorOffset + 4 + (i >> 2)] >> ((i & 3) * 2)) & 3;
+                const target = (y * width + x) * 4;
+                pixels.set(palette.subarray(colorIndex * 4, colorIndex * 4 + 4), target);
+
+                if (blockSize === 16) {
+                    pixels[target + 3] = alphas[this.getAlphaIndex(data, offset, i)];
+                }
+            }
+        }
+
+        return pixels;
+    }
+
+    private getColorPalette(data: Uint8Array, offset: number, palette: Uint8Array, allowTransparent: boolean) {
+        const color0 = data[offset] | (data[offset + 1] << 8);
+        const color1 = data[offset + 2] | (data[offset + 3] << 8);
+        const end0 = this.from565(color0);
+        const end1 = this.from565(color1);
+
+        for (let channel = 0; channel < 3; channel++) {
+            palette[channel] = end0[channel];
+            palette[4 + channel] = end1[channel];
+
+            if (color0 > color1 || !allowTransparent) {
+                palette[8 + channel] = (2 * end0[channel] + end1[channel]) / 3;
+                palette[12 + channel] = (end0[channel] + 2 * end1[channel]) / 3;
+            } else {
+                palette[8 + channel] = (end0[channel] + end1[channel]) / 2;
+                palette[12 + channel] = 0;
+            }
+        }
+
+        palette[3] = palette[7] = palette[11] = 255;
+        palette[15] = color0 > color1 || !allowTransparent ? 255 : 0;
+    }
+
+    private getAlphaPalette(data: Uint8Array, offset: number, alphas: Uint8Array) {
+        const alpha0 = alphas[0] = data[offset];
+        const alpha1 = alphas[1] = data[offset + 1];
+
+        if (alpha0 > alpha1) {
+            for (let i = 1; i < 7; i++) {
+                alphas[i + 1] = ((7 - i) * alpha0 + i * alpha1) / 7;
+            }
+        } else {
+            for (let i = 1; i < 5; i++) {
+                alphas[i + 1] = ((5 - i) * alpha0 + i * alpha1) / 5;
+            }
+            alphas[6] = 0;
+            alphas[7] = 255;
+        }
+    }
+
+    private getAlphaIndex(data: Uint8Array, offset: number, pixel: number) {
+        // 16 3 bit indices in the 6 bytes behind the two alpha values
+        const bit = pixel * 3;
+        const byte = offset + 2 + (bit >> 3);
+        const bits = data[byte] | (data[byte + 1] << 8);
+        return (bits >> (bit & 7)) & 7;
+    }
+
+    private from565(color: number) {
+        const red = (color >> 11) & 31;
+        const green = (color >> 5) & 63;
+        const blue = color & 31;
+        return [(red << 3) | (red >> 2), (green << 2) | (green >> 4), (blue << 3) | (blue >> 2)];
     }
 }
 
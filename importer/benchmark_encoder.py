@@ -0,0 +1,117 @@
+import argparse
+import random
+import struct
+import time
+
+from zipfile import ZipFile, ZIP_STORED
+from io import BytesIO
+
+from importer.data_encoder import ModelEncoder
+
+
+def get_args():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument(
+        '--vertices',
+        type=int,
+        default=100000,
+        help='vertex count of the synthetic mesh'
+    )
+
+    parser.add_argument(
+        '--meshes',
+        type=int,
+        default=20,
+        help='number of meshes the vertices are split into'
+    )
+
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=3,
+        help='runs per encoder, the best one is reported'
+    )
+
+    return parser.parse_args()
+
+
+def build_mesh(num_vertices, num_meshes):
+    rnd = random.Random(0)
+    per_mesh = num_vertices // num_meshes
+
+    vertices, normals, uvs = [], [], []
+    for _ in range(num_meshes):
+        vertices.append([rnd.uniform(-100, 100) for _ in range(per_mesh * 3)])
+        normals.append([[rnd.uniform(-1, 1) for _ in range(3)] for _ in range(per_mesh)])
+        uvs.append([rnd.random() for _ in range(per_mesh * 2)])
+
+    return {
+        'lods': ['level0'],
+        'vertices': {'level0': vertices},
+        'normals': {'level0': normals},
+        'uvs': {'level0': uvs},
+        'materials_per_mesh': {'level0': list(range(num_meshes))},
+    }
+
+
+def legacy_encode(model_data, lod_name):
+    """ the per-entry struct.pack encoder the NumPy path replaced, same output as the legacy model format """
+    result = {}
+    for type_name in ['uvs', 'vertices']:
+        entries = model_data[type_name][lod_name]
+        content = struct.pack('I', len(entries))
+
+        for entry in entries:
+            length = len(entry)
+            content += struct.pack('I', length)
+            content += struct.pack('f' * length, *entry)
+
+        result[type_name] = content
+
+    normals = model_data['normals'][lod_name]
+    content = struct.pack('I', len(normals))
+    for entry in normals:
+        content += struct.pack('I', len(entry))
+        for normal in entry:
+            content += struct.pack('f' * 3, *normal)
+    result['normals'] = content
+
+    return result
+
+
+def array_encode(model_data, lod_name):
+    zf = ZipFile(BytesIO(), mode='w', compression=ZIP_STORED)
+    ModelEncoder('benchmark', 0, model_data, model_format='legacy').write_to_zip(zf)
+
+    return {
+        type_name: zf.read('0.{}.{}.dat'.format(type_name, lod_name))
+        for type_name in ['uvs', 'vertices', 'normals']
+    }
+
+
+def best_of(runs, func, *args):
+    best = None
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        delta = time.perf_counter() - start
+        best = delta if best is None else min(best, delta)
+    return best, result
+
+
+if __name__ == '__main__':
+    args = get_args()
+    model_data = build_mesh(args.vertices, args.meshes)
+
+    legacy_time, legacy = best_of(args.runs, legacy_encode, model_data, 'level0')
+    array_time, array = best_of(args.runs, array_encode, model_data, 'level0')
+
+    if legacy != array:
+        raise SystemExit('encoders disagree, output format changed!')
+
+    size = sum(len(content) for content in array.values())
+    print('{} vertices in {} meshes, {} bytes'.format(args.vertices, args.meshes, size))
+    print('struct.pack encoder: {:.3f}s'.format(legacy_time))
+    print('numpy encoder:       {:.3f}s ({:.1f}x)'.format(array_time, legacy_time / array_time))
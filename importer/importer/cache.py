@@ -0,0 +1,146 @@
+import os
+import json
+import shutil
+import pickle
+import hashlib
+import logging
+
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+
+class ParseCache(object):
+    """
+    persistent cache for parsed CMP models and encoded texture packs.
+
+    entries are keyed by kind, file path, content hash and optional extra
+    parameters. size and mtime of every file are kept in an index, so
+    unchanged files are not even hashed again on the next run.
+
+    entries live in a directory per cache version, others are removed on
+    open. entries a run did not use are removed when it is saved.
+    """
+
+    # bump whenever the cached data layout or the parsed / encoded output for the same input changes
+    VERSION = 2
+
+    def __init__(self, cache_dir, enabled=True, rebuild=False):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.rebuild = rebuild
+
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._index = {}
+        self._entry_dir = os.path.join(cache_dir, 'v{}'.format(self.VERSION))
+        self._used = set()
+
+        if self.enabled and not self.rebuild and os.path.isfile(self._index_path):
+            with open(self._index_path, 'r') as file:
+                self._index = json.load(file)
+
+        if self.enabled:
+            self._prune_versions()
+
+    def get_key(self, kind, path, extra=None):
+        if not self.enabled:
+            return None
+
+        key_data = json.dumps([self.VERSION, kind, path, self._get_content_hash(path), extra])
+        return hashlib.sha1(key_data.encode('utf-8')).hexdigest()
+
+    def has(self, kind, key):
+        if key is None:
+            return False
+
+        self._used.add(self._get_entry_path(kind, key))
+        if self.rebuild:
+            return False
+        return os.path.isfile(self._get_entry_path(kind, key))
+
+    def load(self, kind, key):
+        with open(self._get_entry_path(kind, key), 'rb') as file:
+            data = pickle.load(file)
+
+        self.hits[kind] += 1
+        return data
+
+    def store(self, kind, key, data):
+        self.misses[kind] += 1
+        if key is None:
+            return
+
+        entry_path = self._get_entry_path(kind, key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        with open(entry_path + '.tmp', 'wb') as file:
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(entry_path + '.tmp', entry_path)
+
+    def save(self):
+        if not self.enabled:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._index_path + '.tmp', 'w') as file:
+            json.dump(self._index, file)
+        os.replace(self._index_path + '.tmp', self._index_path)
+
+        self._prune_unused()
+
+    def report(self, logger_fnc):
+        if not self.enabled:
+            logger_fnc('cache disabled')
+            return
+
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            logger_fnc('cache {}: {} hits, {} misses'.format(kind, self.hits[kind], self.misses[kind]))
+
+    def _get_entry_path(self, kind, key):
+        return os.path.join(self._entry_dir, kind, key[:2], '{}.pickle'.format(key))
+
+    def _prune_versions(self):
+        """ removes the entry directories of other cache versions, other files in cache_dir are kept """
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and path != self._entry_dir:
+                _logger.info('removing outdated cache entries in {}'.format(path))
+                shutil.rmtree(path)
+
+    def _prune_unused(self):
+        """ removes entries of files that changed or are gone, every run looks up all of its entries """
+        removed = 0
+        for directory, _, files in os.walk(self._entry_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                if path not in self._used:
+                    os.remove(path)
+                    removed += 1
+
+        if removed:
+            _logger.info('{} unused cache entries removed'.format(removed))
+
+    def _get_content_hash(self, path):
+        stat = os.stat(path)
+        entry = self._index.get(path)
+
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['hash']
+
+        content_hash = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                content_hash.update(chunk)
+
+        self._index[path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': content_hash.hexdigest(),
+        }
+        return self._index[path]['hash']
@@ -1,11 +1,22 @@
 import os
 import logging
+import hashlib
+from collections import defaultdict
 from .pyfl_utils import INIFile, FLDll
+from .pyfl_utils.stringutils import try_decode
 from .errors import ParserError
+from .string_table import StringTable, write_string_table
 
 _logger = logging.getLogger(__name__)
 
 
+def _get_single_value(value):
+    """ the first value of keys that occur more than once in a section """
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
 class ConfigLoader(object):
         
     CONFIG_FILES = [
@@ -14,11 +25,16 @@ class ConfigLoader(object):
         ('DATA', 'EQUIPMENT', 'market_ships.ini'),   
     ]
 
+    INDEXED_KEYS = ['nickname', 'category']
+    RESOURCE_KEYS = ['ids_name', 'ids_info']
+
     def __init__(self, fl_ini_path):
         self.fl_ini = INIFile(fl_ini_path)
         self._dll_paths_by_index = {}
         self._loaded_inis = {}
         self._loaded_dlls = {}
+        self._indexes = {}
+        self._string_table = None
 
         self.goods = None
         self.shiparch = None
@@ -45,9 +61,32 @@ class ConfigLoader(object):
                 ini_file = INIFile(full_path)
                 setattr(self, base_name, ini_file)
                 self._loaded_inis[full_path.lower()] = ini_file
+                self._build_indexes(base_name, ini_file)
             else:
                 _logger.error('could not load {}.ini'.format(base_name))
          
+    def _build_indexes(self, base_name, ini_file):
+        indexes = {key: defaultdict(list) for key in self.INDEXED_KEYS}
+
+        for section in ini_file.sections:
+            for key in self.INDEXED_KEYS:
+                value = _get_single_value(section.get(key))
+                if value is not None:
+                    indexes[key][str(value).lower()].append(section)
+
+        self._indexes[base_name] = indexes
+
+    def get_by_kv(self, ini_name, key, value, multiple=True):
+        """ indexed lookup on one of the CONFIG_FILES, key has to be one of INDEXED_KEYS """
+        if ini_name not in self._indexes:
+            raise ParserError('{}.ini not loaded!'.format(ini_name))
+
+        sections = self._indexes[ini_name][key].get(str(value).lower(), [])
+
+        if multiple:
+            return sections
+        return sections[0] if sections else None
+
     def get_absolute_path(self, *args):
         full_path = os.path.join(self.base_path, *args)      
         full_path = full_path.lower()
@@ -66,14 +105,95 @@ class ConfigLoader(object):
             raise ParserError('freelancer.ini not loaded!')
                         
         ini_id = int(ini_id)
-        
-        dll_index = ((ini_id - (ini_id % 65536)) / 65536) - 1
-        
-        if dll_index < 0:
-            dll_index = 0
-        
+        dll_index = self._get_dll_index(ini_id)
+
         self._load_dll(dll_index)
         return self._loaded_dlls[dll_index].get_by_id(ini_id)
+
+    def get_resource_string(self, ini_id):
+        """ decoded resource string, served from the string table if one is loaded """
+        ini_id = _get_single_value(ini_id)
+        if self._string_table is not None:
+            content = self._string_table.get(ini_id)
+            if content is not None:
+                return content
+
+        return try_decode(self.get_dll_string(ini_id))
+
+    def load_string_table(self, path, rebuild=False):
+        """
+        opens the string table at path. if it is missing, unreadable or was
+        built from other DLLs or another set of ids referenced by the config
+        inis, all ids_name / ids_info strings are decoded in one pass over
+        the DLLs and the table is rewritten.
+        """
+        wanted = self._get_resource_ids()
+        fingerprint = self._get_fingerprint(wanted)
+
+        table = None
+        if not rebuild and os.path.isfile(path):
+            try:
+                table = StringTable(path)
+            except ValueError as error:
+                _logger.warning('rebuilding string table: {}'.format(error))
+
+            if table is not None and table.fingerprint != fingerprint:
+                table.close()
+                table = None
+
+        if table is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            write_string_table(path, self._decode_resource_strings(wanted), fingerprint)
+            table = StringTable(path)
+            _logger.info('string table with {} strings written'.format(table.count))
+
+        self._string_table = table
+
+    def _get_resource_ids(self):
+        ids = set()
+        for ini_name in self._indexes:
+            for section in getattr(self, ini_name).sections:
+                for key in self.RESOURCE_KEYS:
+                    value = _get_single_value(section.get(key))
+                    if value and int(value) != 0:
+                        ids.add(int(value))
+        return ids
+
+    def _decode_resource_strings(self, wanted):
+        # grouped by DLL, so every DLL is loaded and walked only once
+        by_dll = defaultdict(list)
+        for ini_id in wanted:
+            by_dll[self._get_dll_index(ini_id)].append(ini_id)
+
+        strings = {}
+        for dll_index in sorted(by_dll):
+            self._load_dll(dll_index)
+            if dll_index not in self._loaded_dlls:
+                continue
+
+            for ini_id in sorted(by_dll[dll_index]):
+                content = self._loaded_dlls[dll_index].get_by_id(ini_id)
+                if content is not None:
+                    strings[ini_id] = try_decode(content)
+        return strings
+
+    def _get_fingerprint(self, wanted):
+        """ identifies the DLLs and the wanted ids, ids without a string are not stored in the table """
+        fingerprint = hashlib.sha1()
+        fingerprint.update(','.join(str(ini_id) for ini_id in sorted(wanted)).encode('utf-8'))
+        for dll_index in sorted(self._dll_paths_by_index):
+            dll_path = self._dll_paths_by_index[dll_index]
+            stat = os.stat(dll_path) if os.path.isfile(dll_path) else None
+
+            fingerprint.update('{}:{}:{}:{};'.format(
+                dll_index, dll_path, stat.st_size if stat else -1, stat.st_mtime if stat else -1,
+            ).encode('utf-8'))
+        return fingerprint.digest()
+
+    @staticmethod
+    def _get_dll_index(ini_id):
+        # ids 0 - 65535 live in resources.dll, which is not part of the [Resources] list
+        return max(ini_id // 65536 - 1, 0)
         
     def get_loaded_dll(self, dll_index):
         self._load_dll(dll_index)
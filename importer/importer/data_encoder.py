@@ -1,24 +1,240 @@
 import struct
 import json
+import logging
+import numpy as np
 from .pyfl_utils.models.texturepack import TexturePack
+from .dxt import encode_dxt
+
+_logger = logging.getLogger(__name__)
+
+
+def pack_float_entries(entries):
+    """
+    encodes a list of float entries (flat lists or lists of triples) as
+    uint32 count, then per entry uint32 length and the float32 data,
+    filled into one contiguous little endian buffer
+    """
+    arrays = [np.asarray(entry, dtype='<f4').reshape(-1) for entry in entries]
+
+    buffer = np.empty(1 + len(arrays) + sum(array.size for array in arrays), dtype='<u4')
+    floats = buffer.view('<f4')
+
+    buffer[0] = len(arrays)
+    offset = 1
+    for entry, array in zip(entries, arrays):
+        buffer[offset] = len(entry)
+        floats[offset + 1:offset + 1 + array.size] = array
+        offset += 1 + array.size
+
+    return memoryview(buffer).cast('B')
+
+
+# indexed mesh file, one per LOD (little endian):
+#   header  magic 'FLMS', uint8 version, uint8 flags, uint16 mesh count
+#   meshes  mesh count * (uint32 material id, uint32 vertex count, uint32 index count, uint32 data offset)
+#           followed by float32 position offset xyz and position step xyz if the file is quantized
+#   data    per mesh at its offset: the vertices, padded to 4 bytes, then the triangle indices,
+#           uint16 for up to 65536 vertices, uint32 above, padded to 4 bytes
+#
+# vertices are interleaved float32 (position xyz, normal xyz, uv) or, with MESH_QUANTIZED,
+# int16 position xyz (position = offset + value * step), int16 octahedral normal xy and float16 uv
+MESH_MAGIC = b'FLMS'
+MESH_VERSION = 1
+MESH_HEADER = struct.Struct('<4sBBH')
+MESH_ENTRY = struct.Struct('<IIII')
+MESH_QUANTIZATION = struct.Struct('<6f')
+
+# header flags
+MESH_QUANTIZED = 1
+
+# floats per vertex: position, normal, uv
+VERTEX_COMPONENTS = 8
+
+INT16_MAX = 32767
+
+
+def weld_vertices(attributes):
+    """
+    merges identical rows of a (n, components) array, returns the unique
+    rows in order of their first use and the index of every input row
+    """
+    attributes = np.ascontiguousarray(attributes)
+    keys = attributes.view(np.dtype((np.void, attributes.dtype.itemsize * attributes.shape[1]))).reshape(-1)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    # np.unique sorts by bytes, keep the original order for a better vertex cache hit rate
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+
+    return attributes[first[order]], rank[inverse.reshape(-1)]
+
+
+def get_mesh_attributes(vertices, normals, uvs):
+    """ interleaves one mesh of the triangle soup to (n, VERTEX_COMPONENTS) float32 """
+    positions = np.asarray(vertices, dtype='<f4').reshape(-1, 3)
+    normals = np.asarray(normals, dtype='<f4').reshape(-1, 3)
+    uvs = np.asarray(uvs, dtype='<f4').reshape(-1, 2)
+
+    if not len(positions) == len(normals) == len(uvs):
+        raise ValueError('mesh has {} vertices, {} normals and {} uvs'.format(len(positions), len(normals), len(uvs)))
+    return np.hstack([positions, normals, uvs])
+
+
+def _sign(values):
+    return np.where(values >= 0, 1.0, -1.0)
+
+
+def encode_octahedral(normals):
+    """ (n, 3) unit vectors to (n, 2) int16, the vector projected on an octahedron and unfolded to a square """
+    normals = np.asarray(normals, dtype='<f8')
+    length = np.abs(normals).sum(axis=1, keepdims=True)
+    normals = normals / np.where(length > 0, length, 1)
+
+    x, y, z = normals[:, 0], normals[:, 1], normals[:, 2]
+    folded = z < 0
+    x, y = np.where(folded, (1 - np.abs(y)) * _sign(x), x), np.where(folded, (1 - np.abs(x)) * _sign(y), y)
+
+    return np.round(np.clip(np.stack([x, y], axis=1), -1, 1) * INT16_MAX).astype('<i2')
+
+
+def decode_octahedral(encoded):
+    """ inverse of encode_octahedral, (n, 3) unit vectors """
+    x, y = (encoded.astype('<f8') / INT16_MAX).T
+    z = 1 - np.abs(x) - np.abs(y)
+    folded = z < 0
+    x, y = np.where(folded, (1 - np.abs(y)) * _sign(x), x), np.where(folded, (1 - np.abs(x)) * _sign(y), y)
+
+    normals = np.stack([x, y, z], axis=1)
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+def quantize_attributes(attributes):
+    """
+    quantizes (n, VERTEX_COMPONENTS) float32 to (n, 7) uint16 rows, the
+    bytes of int16 position, int16 octahedral normal and float16 uv.
+    returns the rows, the position offset and step of the mesh bounding
+    box and the largest position, normal (degrees) and uv error
+    """
+    positions, normals, uvs = attributes[:, :3], attributes[:, 3:6], attributes[:, 6:]
+
+    if not len(attributes):
+        # an empty mesh has no bounding box
+        return np.empty((0, 7), dtype='<u2'), (0.0, 0.0, 0.0, 1.0, 1.0, 1.0), (0.0, 0.0, 0.0)
+
+    low, high = positions.min(axis=0), positions.max(axis=0)
+    offset = ((low + high) / 2).astype('<f4')
+    step = ((high - low) / (2 * INT16_MAX)).astype('<f4')
+    step[step == 0] = 1
+
+    quantized_positions = np.clip(np.round((positions - offset) / step), -INT16_MAX, INT16_MAX).astype('<i2')
+    quantized_normals = encode_octahedral(normals)
+    quantized_uvs = uvs.astype('<f2')
+
+    rows = np.hstack([
+        quantized_positions.view('<u2'), quantized_normals.view('<u2'), quantized_uvs.view('<u2'),
+    ])
+
+    unit_normals = normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    cosines = np.clip((decode_octahedral(quantized_normals) * unit_normals).sum(axis=1), -1, 1)
+    errors = (
+        float(np.abs(offset + quantized_positions * step - positions).max()),
+        float(np.degrees(np.arccos(cosines)).max()),
+        float(np.abs(quantized_uvs.astype('<f4') - uvs).max()),
+    )
+
+    return rows, tuple(offset) + tuple(step), errors
+
+
+def encode_mesh_file(meshes, flags=0):
+    """
+    meshes is a list of (material id, vertex data, indices, quantization),
+    vertex data is written as it is, quantization is the position offset
+    and step of quantized files
+    """
+    entry_size = MESH_ENTRY.size + (MESH_QUANTIZATION.size if flags & MESH_QUANTIZED else 0)
+    offset = MESH_HEADER.size + entry_size * len(meshes)
+    header = [MESH_HEADER.pack(MESH_MAGIC, MESH_VERSION, flags, len(meshes))]
+    blocks = []
+
+    for material_id, vertex_data, indices, quantization in meshes:
+        index_type = '<u2' if len(vertex_data) <= 0x10000 else '<u4'
+        data = vertex_data.tobytes()
+        data += b'\0' * (-len(data) % 4)
+        data += indices.astype(index_type).tobytes()
+        data += b'\0' * (-len(data) % 4)
+
+        header.append(MESH_ENTRY.pack(material_id, len(vertex_data), len(indices), offset))
+        if flags & MESH_QUANTIZED:
+            header.append(MESH_QUANTIZATION.pack(*quantization))
+        blocks.append(data)
+        offset += len(data)
+
+    return b''.join(header + blocks)
+
 
 class ModelEncoder(object):
+    """ writes the LODs of a model, as (quantized) indexed mesh files or in the legacy per attribute format """
+
+    FORMATS = ['mesh', 'quantized', 'legacy']
 
-    def __init__(self, ship_name, import_id, model_data):
+    def __init__(self, ship_name, import_id, model_data, model_format='mesh'):
         self.ship_name = ship_name
         self.import_id = import_id
         self.data = model_data
+        self.model_format = model_format
+
+        # largest position, normal (degrees) and uv error of the quantized LODs
+        self.max_errors = (0.0, 0.0, 0.0)
 
         self.lods = model_data['lods']
     
     def write_to_zip(self, zf):
         inventory = []
         for lod_name in self.lods:
-            inventory += self._write_lod_file(zf, lod_name)
-        
+            if self.model_format == 'legacy':
+                inventory += self._write_lod_file(zf, lod_name)
+            else:
+                inventory.append(self._write_mesh_file(zf, lod_name))
+
+        if self.model_format == 'quantized':
+            _logger.info('{}: max quantization error position {:.3g}, normal {:.3g} deg, uv {:.3g}'.format(
+                self.ship_name, *self.max_errors
+            ))
+
         self.data = None
         return inventory
-        
+
+    def get_meshes(self, lod_name, quantize=False):
+        """ welded (material id, vertex data, indices, quantization) per mesh """
+        materials = self.data['materials_per_mesh'][lod_name]
+        meshes = []
+
+        for index, vertices in enumerate(self.data['vertices'][lod_name]):
+            attributes = get_mesh_attributes(
+                vertices, self.data['normals'][lod_name][index], self.data['uvs'][lod_name][index],
+            )
+
+            quantization = None
+            if quantize:
+                # welding after quantizing also merges vertices closer than the precision
+                attributes, quantization, errors = quantize_attributes(attributes)
+                self.max_errors = tuple(max(pair) for pair in zip(self.max_errors, errors))
+
+            vertex_data, indices = weld_vertices(attributes)
+            meshes.append((materials[index] if index < len(materials) else 0, vertex_data, indices, quantization))
+
+        return meshes
+
+    def _write_mesh_file(self, zf, lod_name):
+        filename = '{}.mesh.{}.dat'.format(self.import_id, lod_name.lower())
+        quantize = self.model_format == 'quantized'
+
+        with zf.open(filename, 'w') as handle:
+            handle.write(encode_mesh_file(self.get_meshes(lod_name, quantize), MESH_QUANTIZED if quantize else 0))
+
+        return filename
+
     def _write_lod_file(self, zf, lod_name):
         type_name = 'uvs'
 
@@ -33,88 +249,154 @@ class ModelEncoder(object):
     def _write_uv_vert(self, zf, lod_name, type_name, data):
         filename = '{}.{}.{}.dat'.format(self.import_id, type_name, lod_name.lower())
 
-        entries = self.data[type_name][lod_name]
-        content = struct.pack('I', len(entries))
-
-        for entry in entries:
-            length = len(entry)
-            content += struct.pack('I', length)
-            content += struct.pack('f' * length, *entry)
+        with zf.open(filename, 'w') as handle:
+            handle.write(pack_float_entries(self.data[type_name][lod_name]))
 
-        zf.writestr(filename, content)
         return filename
 
     def _write_normals(self, zf, lod_name):
         filename = '{}.{}.{}.dat'.format(self.import_id, 'normals', lod_name.lower())
 
-        normals = self.data['normals'][lod_name]
+        # entries are lists of triples, their length prefix is the normal count
+        with zf.open(filename, 'w') as handle:
+            handle.write(pack_float_entries(self.data['normals'][lod_name]))
 
-        content = struct.pack('I', len(normals))
-        for entry in normals:
-            
-            content += struct.pack('I', len(entry))
-            for normal in entry:
-                content += struct.pack('f' * 3, *normal)
-
-        zf.writestr(filename, content)
         return filename
 
     def _write_mat_ids(self, zf, lod_name):
         filename = '{}.{}.{}.dat'.format(self.import_id, 'materials', lod_name.lower())        
         mat_ids = self.data['materials_per_mesh'][lod_name]
 
-        content = struct.pack('I' * len(mat_ids), *mat_ids)
+        with zf.open(filename, 'w') as handle:
+            handle.write(struct.pack('I' * len(mat_ids), *mat_ids))
 
-        zf.writestr(filename, content)
         return filename
 
+# texture file (little endian):
+#   header  magic 'FLTX', uint8 version, uint8 format, uint8 flags, uint8 level count, uint32 width, uint32 height
+#   data    per mip level, largest first: RGBA8 pixels or DXT1/DXT5 blocks, each level half
+#           the size of the one before (at least 1), down to 1x1 for power of two textures
+# files without the magic are the older uint32 width, uint32 height, bool inversion, RGBA8 layout
+TEXTURE_MAGIC = b'FLTX'
+TEXTURE_VERSION = 1
+TEXTURE_HEADER = struct.Struct('<4sBBBBII')
+
+TEXTURE_FORMATS = ['rgba', 'dxt1', 'dxt5']
+
+# header flags, rows are stored bottom up
+TEXTURE_INVERTED = 1
+
+
+def get_texture_format(content):
+    """ format name of an encoded texture """
+    if content[:len(TEXTURE_MAGIC)] != TEXTURE_MAGIC:
+        return 'rgba'
+    return TEXTURE_FORMATS[TEXTURE_HEADER.unpack_from(content)[2]]
+
+
+def _is_power_of_2(value):
+    return value > 0 and value & (value - 1) == 0
+
+
+def get_mip_chain(rgba):
+    """
+    the (height, width, 4) uint8 image and its box filtered mip levels down
+    to 1x1, only the image itself if a side is not a power of two
+    """
+    levels = [rgba]
+    if not (_is_power_of_2(rgba.shape[0]) and _is_power_of_2(rgba.shape[1])):
+        return levels
+
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        level = levels[-1].astype(np.uint16)
+        if level.shape[0] > 1:
+            level = level[0::2] + level[1::2]
+        else:
+            level = level * 2
+        if level.shape[1] > 1:
+            level = level[:, 0::2] + level[:, 1::2]
+        else:
+            level = level * 2
+
+        levels.append(((level + 2) // 4).astype(np.uint8))
+
+    return levels
+
+
 class TextureEncoder(object):
-    def __init__(self, pack_id, material_ids, mat_path, parent):
-        self.textures = None
-        self.additions = None
-        self.meta = None
-        self.pack_id = pack_id
+    # dxt: block compressed where the size allows it, rgba: uncompressed
+    FORMATS = ['dxt', 'rgba']
+
+    def __init__(self, material_ids, mat_file, parent, texture_format='dxt', sizes=None):
         self.material_ids = material_ids
-        self.mat_path = mat_path
+        self.mat_file = mat_file
         self.parent = parent
+        self.texture_format = texture_format
 
-    def load(self):
-        full_pack = TexturePack(self.material_ids, [self.mat_path], self.parent)
-        self.textures = full_pack.get_textures()
-        self.additions = full_pack.get_additions()
-        self.meta = full_pack.get_meta()
+        # longest side of the size capped variants of base textures
+        self.sizes = sizes or []
 
-    def write_to_zip(self, zf):
-        self.load()
+    def encode(self):
+        """ decodes the material library once, returns the texture ids and (filename, content) entries """
+        full_pack = TexturePack(self.material_ids, [self.mat_file], self.parent)
+        textures = full_pack.get_textures()
+        additions = full_pack.get_additions()
+        meta = full_pack.get_meta()
 
-        inventory = []
-        for tex_id, tex in self.textures.items():
-            self._write_texture(zf, tex_id, tex, inventory)
+        entries = []
+        for tex_id, tex in textures.items():
+            files = self._encode_texture(tex, self.sizes)
+            entries.append(('{}.tex'.format(tex_id), files.pop(None)))
+            for size in sorted(files):
+                entries.append(('{}.{}.tex'.format(tex_id, size), files[size]))
 
-            for key in self.additions[tex_id]:
-                self._write_texture(zf, '{}.{}'.format(tex_id, key), self.additions[tex_id][key], inventory)
+            for key in additions[tex_id]:
+                entries.append(('{}.{}.tex'.format(tex_id, key), self._encode_texture(additions[tex_id][key])[None]))
 
-            if tex_id in self.meta:
-                self._write_meta(zf, tex_id, self.meta[tex_id], inventory)
+            if tex_id in meta:
+                entries.append(('{}.meta.tex'.format(tex_id), json.dumps(meta[tex_id]).encode('utf-8')))
 
-        self.textures = None
-        self.additions = None
-        return inventory
+        return list(textures.keys()), entries
+
+    def _encode_texture(self, tex, sizes=()):
+        """
+        {None: full texture, size: variant} with a mip chain each, a variant
+        starts at the first level within the size and exists for sizes below
+        the texture size only. textures without a mip chain have no level
+        within a smaller size, so they get no variants
+        """
+        rgba = np.frombuffer(tex.rgb_matrix, dtype=np.uint8).reshape(tex.iy, tex.ix, 4)
+        texture_format, flags = 0, TEXTURE_INVERTED if tex.inversion else 0
+
+        # DXT blocks need sides divisible by 4, anything else stays RGBA
+        if self.texture_format == 'dxt' and not tex.ix % 4 and not tex.iy % 4:
+            # compressed uploads can not be flipped by WebGL, so the rows are flipped here
+            if tex.inversion:
+                rgba = rgba[::-1]
+
+            with_alpha = bool((rgba[..., 3] != 255).any())
+            texture_format, flags = TEXTURE_FORMATS.index('dxt5' if with_alpha else 'dxt1'), 0
 
-    def _write_meta(self, zf, tex_id, data, inventory):
-        filename = '{}.{}.meta.tex'.format(self.pack_id, tex_id)
-        content = json.dumps(data)
+        levels = get_mip_chain(np.ascontiguousarray(rgba))
+        encoded = [
+            encode_dxt(level, texture_format == TEXTURE_FORMATS.index('dxt5')) if texture_format else level.tobytes()
+            for level in levels
+        ]
 
-        zf.writestr(filename, content)
-        inventory.append(filename)
+        files = {}
+        for size in [None] + [size for size in sizes if size < max(tex.ix, tex.iy)]:
+            first = 0
+            while size is not None and first < len(levels) - 1 and max(levels[first].shape[:2]) > size:
+                first += 1
 
-    def _write_texture(self, zf, tex_id, tex, inventory):
-        filename = '{}.{}.tex'.format(self.pack_id, tex_id)
+            if size is not None and max(levels[first].shape[:2]) > size:
+                _logger.debug('no {} variant for a {}x{} texture'.format(size, tex.ix, tex.iy))
+                continue
 
-        content = struct.pack('I', tex.ix)
-        content += struct.pack('I', tex.iy)
-        content += struct.pack('?', tex.inversion)
-        content += tex.rgb_matrix
+            height, width = levels[first].shape[:2]
+            header = TEXTURE_HEADER.pack(
+                TEXTURE_MAGIC, TEXTURE_VERSION, texture_format, flags, len(levels) - first, width, height,
+            )
+            files[size] = header + b''.join(encoded[first:])
 
-        zf.writestr(filename, content)
-        inventory.append(filename)
+        return files
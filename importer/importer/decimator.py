@@ -0,0 +1,142 @@
+import logging
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+# resolution bounds of the clustering grid, cells along the longest bounding box side
+MIN_RESOLUTION = 2
+MAX_RESOLUTION = 4096
+
+
+def _get_cells(positions, resolution):
+    """ cubic grid cell id of every position, the grid spans the bounding box """
+    low = positions.min(axis=0)
+    size = max(float((positions.max(axis=0) - low).max()), 1e-9) / resolution
+    cells = np.minimum(((positions - low) / size).astype(np.int64), resolution)
+
+    side = resolution + 1
+    return (cells[:, 0] * side + cells[:, 1]) * side + cells[:, 2]
+
+
+def _cluster(positions, resolution):
+    """ the triangles left after snapping every vertex to its cell, as indices of their first corner """
+    corners = _get_cells(positions, resolution).reshape(-1, 3)
+
+    # triangles collapse if two corners share a cell
+    alive = (corners[:, 0] != corners[:, 1]) & (corners[:, 1] != corners[:, 2]) & (corners[:, 0] != corners[:, 2])
+    triangles = np.flatnonzero(alive)
+    corners = corners[alive]
+
+    # rotate the smallest cell first, which keeps the winding, and drop duplicates
+    shift = corners.argmin(axis=1)
+    rows = np.arange(len(corners))[:, None]
+    corners = corners[rows, (shift[:, None] + np.arange(3)) % 3]
+    keys = corners.view(np.dtype((np.void, corners.dtype.itemsize * 3))).reshape(-1)
+    _, first = np.unique(keys, return_index=True)
+
+    return triangles[np.sort(first)]
+
+
+def decimate_mesh(positions, normals, uvs, target):
+    """
+    vertex clustering of a triangle soup ((n, 3) positions and normals,
+    (n, 2) uvs) to at most target triangles. every vertex moves to the
+    mean position of its grid cell, the finest grid within the budget is
+    found by bisection. corners keep their normal and uv, so texture seams
+    stay intact. returns the soup arrays, above target if not even the
+    coarsest grid fits and unchanged if that grid leaves nothing
+    """
+    if len(positions) // 3 <= target:
+        return positions, normals, uvs
+
+    low, high = MIN_RESOLUTION, MAX_RESOLUTION
+    triangles = None
+    while low <= high:
+        resolution = (low + high) // 2
+        candidate = _cluster(positions, resolution)
+        if len(candidate) <= target:
+            triangles, best = candidate, resolution
+            low = resolution + 1
+        else:
+            high = resolution - 1
+
+    if triangles is None:
+        best = MIN_RESOLUTION
+        triangles = _cluster(positions, best)
+
+    if not len(triangles):
+        return positions, normals, uvs
+
+    _, cluster = np.unique(_get_cells(positions, best), return_inverse=True)
+    cluster = cluster.reshape(-1)
+    counts = np.bincount(cluster)
+    means = np.stack([np.bincount(cluster, positions[:, axis]) for axis in range(3)], axis=1) / counts[:, None]
+
+    vertices = (triangles[:, None] * 3 + np.arange(3)).reshape(-1)
+    return means[cluster[vertices]].astype(positions.dtype), normals[vertices], uvs[vertices]
+
+
+def get_triangle_count(model_data, lod_name):
+    return sum(len(np.asarray(vertices).reshape(-1)) // 9 for vertices in model_data['vertices'][lod_name])
+
+
+def generate_lods(model_data, budgets):
+    """
+    adds decimated LODs to model_data for every triangle budget below the
+    triangle count of its lightest LOD, derived from the heaviest one.
+    the new LODs continue the LevelN numbering, returns their names
+    """
+    source = model_data['lods'][0]
+    source_materials = model_data['materials_per_mesh'][source]
+    lightest = get_triangle_count(model_data, model_data['lods'][-1])
+    total = get_triangle_count(model_data, source)
+
+    generated = []
+    for budget in sorted(budgets, reverse=True):
+        if budget >= lightest or not total:
+            continue
+
+        vertices, normals, uvs, materials = [], [], [], []
+        for index, mesh_vertices in enumerate(model_data['vertices'][source]):
+            positions = np.asarray(mesh_vertices, dtype='<f4').reshape(-1, 3)
+
+            # the budget is shared in proportion to the triangles of every mesh
+            target = max(1, budget * (len(positions) // 3) // total)
+            mesh = decimate_mesh(
+                positions,
+                np.asarray(model_data['normals'][source][index], dtype='<f4').reshape(-1, 3),
+                np.asarray(model_data['uvs'][source][index], dtype='<f4').reshape(-1, 2),
+                target,
+            )
+            if len(mesh[0]) // 3 > target:
+                # small meshes keep more than their share rather than disappearing
+                _logger.warning('mesh {} keeps {} triangles, {} over its share of the {} budget'.format(
+                    index, len(mesh[0]) // 3, len(mesh[0]) // 3 - target, budget,
+                ))
+
+            vertices.append(mesh[0].reshape(-1))
+            normals.append(mesh[1])
+            uvs.append(mesh[2].reshape(-1))
+            materials.append(source_materials[index] if index < len(source_materials) else 0)
+
+        if not vertices:
+            break
+
+        # file names use the lowercased LOD name, so existing names are compared that way
+        taken = set(name.lower() for name in model_data['lods'])
+        level = len(model_data['lods'])
+        while 'level{}'.format(level) in taken:
+            level += 1
+
+        lod_name = 'Level{}'.format(level)
+        model_data['lods'].append(lod_name)
+        model_data['vertices'][lod_name] = vertices
+        model_data['normals'][lod_name] = normals
+        model_data['uvs'][lod_name] = uvs
+        model_data['materials_per_mesh'][lod_name] = materials
+
+        generated.append(lod_name)
+        lightest = sum(len(mesh) // 9 for mesh in vertices)
+
+    return generated
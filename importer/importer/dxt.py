@@ -0,0 +1,99 @@
+"""
+vectorized DXT1 (BC1) and DXT5 (BC3) block compression with numpy.
+
+every 4x4 block is encoded with the endpoints of its (slightly inset)
+color bounding box and the nearest palette entry per pixel, the same
+range fit real-time encoders use. quality is below an exhaustive search,
+but a 1024x1024 texture takes well under a second.
+"""
+import numpy as np
+
+# blocks encoded per step, bounds the size of the temporary arrays
+CHUNK_BLOCKS = 16384
+
+
+def get_blocks(rgba):
+    """ (height, width, 4) uint8 with sides divisible by 4 to (block count, 16, 4), row by row """
+    height, width = rgba.shape[:2]
+    blocks = rgba.reshape(height // 4, 4, width // 4, 4, 4).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(-1, 16, 4)
+
+
+def _to_565(colors):
+    colors = colors.astype(np.int32)
+    return ((colors[..., 0] * 31 + 127) // 255 << 11) | ((colors[..., 1] * 63 + 127) // 255 << 5) | \
+        ((colors[..., 2] * 31 + 127) // 255)
+
+
+def _from_565(packed):
+    red, green, blue = (packed >> 11) & 31, (packed >> 5) & 63, packed & 31
+    return np.stack([(red << 3) | (red >> 2), (green << 2) | (green >> 4), (blue << 3) | (blue >> 2)], axis=-1)
+
+
+def _nearest(values, palette):
+    """ index of the closest palette entry for every value, (n, 16, c) and (n, k, c) """
+    distances = [((values - palette[:, None, index]) ** 2).sum(axis=-1) for index in range(palette.shape[1])]
+    return np.argmin(np.stack(distances, axis=-1), axis=-1)
+
+
+def _pack_indices(indices, bits):
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(bits)
+    return (indices.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+
+
+def _encode_color_blocks(pixels):
+    """ (n, 16, 3) to (n, 8) uint8, color endpoints with color0 > color1 for 4 color interpolation """
+    pixels = pixels.astype(np.int32)
+    low, high = pixels.min(axis=1), pixels.max(axis=1)
+    inset = (high - low) // 16
+    color0, color1 = _to_565(high - inset), _to_565(low + inset)
+
+    # 4 color mode needs color0 > color1
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+    end0, end1 = _from_565(color0), _from_565(color1)
+    palette = np.stack([end0, end1, (2 * end0 + end1) // 3, (end0 + 2 * end1) // 3], axis=1)
+    indices = _nearest(pixels, palette)
+    indices[color0 == color1] = 0
+
+    result = np.zeros((len(pixels), 8), dtype=np.uint8)
+    result[:, 0:2] = color0.astype('<u2')[:, None].view(np.uint8)
+    result[:, 2:4] = color1.astype('<u2')[:, None].view(np.uint8)
+    result[:, 4:8] = _pack_indices(indices, 2).astype('<u4')[:, None].view(np.uint8)
+    return result
+
+
+def _encode_alpha_blocks(alpha):
+    """ (n, 16) to (n, 8) uint8, alpha0 > alpha1 for 8 value interpolation """
+    alpha = alpha.astype(np.int32)
+    alpha0, alpha1 = alpha.max(axis=1), alpha.min(axis=1)
+
+    weights = np.arange(1, 7)
+    steps = ((7 - weights) * alpha0[:, None] + weights * alpha1[:, None]) // 7
+    palette = np.concatenate([alpha0[:, None], alpha1[:, None], steps], axis=1)
+    indices = _nearest(alpha[..., None], palette[..., None])
+    indices[alpha0 == alpha1] = 0
+
+    result = np.zeros((len(alpha), 8), dtype=np.uint8)
+    result[:, 0] = alpha0
+    result[:, 1] = alpha1
+    result[:, 2:8] = _pack_indices(indices, 3).astype('<u8')[:, None].view(np.uint8)[:, :6]
+    return result
+
+
+def encode_dxt(rgba, with_alpha):
+    """ DXT5 blocks of a (height, width, 4) uint8 image if with_alpha, else DXT1 """
+    # the 2x2 and 1x1 mip levels fill partial blocks, the padding is never sampled
+    height, width = rgba.shape[:2]
+    if height % 4 or width % 4:
+        rgba = np.pad(rgba, ((0, -height % 4), (0, -width % 4), (0, 0)), mode='edge')
+
+    blocks = get_blocks(rgba)
+    encoded = []
+    for start in range(0, len(blocks), CHUNK_BLOCKS):
+        chunk = blocks[start:start + CHUNK_BLOCKS]
+        color = _encode_color_blocks(chunk[..., :3])
+        encoded.append(np.hstack([_encode_alpha_blocks(chunk[..., 3]), color]) if with_alpha else color)
+
+    return np.concatenate(encoded).tobytes() if encoded else b''
@@ -2,19 +2,20 @@ import os
 import logging
 import json
 
-from io import BytesIO
+from io import TextIOWrapper
+from collections import deque
 from zipfile import ZipFile, ZIP_DEFLATED
+from concurrent.futures import ProcessPoolExecutor
 
-from .pyfl_utils import UTFFile, concat_lists
-from .pyfl_utils.models.cmpmodel import CMPModel
-from .pyfl_utils.models.texturepack import TexturePack
-from .pyfl_utils.stringutils import try_decode
+from .pyfl_utils import concat_lists
 
+from .cache import ParseCache
 from .config_loader import ConfigLoader
 from .errors import ParserError
-from .hardpoint_parser import HardpointParser
 from .timer import Timer
-from .data_encoder import ModelEncoder, TextureEncoder
+from .data_encoder import ModelEncoder, get_texture_format
+from .workers import parse_ship_model, encode_texture_pack
+from .zip_writer import ZipWriterThread
 
 _logger = logging.getLogger(__name__)
 
@@ -30,6 +31,13 @@ class ShipDataImporter(object):
 
     def __init__(self, args):
         self.mat_map = {}
+        self.jobs = max(1, args.jobs)
+        self.stream = args.stream
+        self.model_format = args.model_format
+        self.texture_format = args.texture_format
+        self.texture_sizes = [int(size) for size in args.texture_sizes.split(',') if size.strip()]
+        self.lod_budgets = [int(budget) for budget in args.lod_budgets.split(',') if budget.strip()]
+        self.cache = ParseCache(args.cache_dir, enabled=not args.no_cache, rebuild=args.rebuild_cache)
 
         fl_ini = os.path.join(args.root, 'EXE', 'freelancer.ini')
         if not os.path.isfile(fl_ini):
@@ -37,77 +45,129 @@ class ShipDataImporter(object):
         self.config = ConfigLoader(fl_ini)
         _logger.debug('config loaded')
 
+        if self.cache.enabled:
+            self.config.load_string_table(os.path.join(args.cache_dir, 'resources.strtab'), rebuild=args.rebuild_cache)
+            _logger.debug('string table loaded')
+
         self.data_files = []
-        
+        self.inventory = []
 
     def run_import(self):
         self.timer = Timer(_logger.info)
         self.timer.start()
 
-        ships_data = self._get_ships()
-        self.timer.step('data parsed')
-        
-        content = json.dumps(ships_data).encode('utf-8')
-        self.timer.step('data dumped')
+        with ZipFile('output.zip', mode='w', compression=ZIP_DEFLATED) as zf:
+            ships_data = self._get_ships(zf)
+            self.timer.step('data parsed')
 
-        _logger.debug('size: {}'.format(len(content)))
+            self.timer.start()
+            for data_file in self.data_files:
+                self.inventory += data_file.write_to_zip(zf)
+            self.data_files = []
+            self.timer.step('model files saved')
 
-        with open('debug.json', 'wb') as file:
-            file.write(content)
+            self.inventory += self._get_textures(ships_data, zf)
+            self.timer.step('textures parsed and saved')
 
-        buffer = BytesIO()
-        with ZipFile('output.zip', mode='w', compression=ZIP_DEFLATED) as zf:
-            self.timer.start()
-            zf.writestr('data.json', content)
-            self.timer.step('main ship data saved to zip')
+            if self.stream:
+                with TextIOWrapper(zf.open('data.json', 'w'), encoding='utf-8') as handle:
+                    json.dump(ships_data, handle)
+            else:
+                content = json.dumps(ships_data).encode('utf-8')
+                _logger.debug('size: {}'.format(len(content)))
 
-            inventory = []
-            for data_file in self.data_files:
-                inventory += data_file.write_to_zip(zf)
+                with open('debug.json', 'wb') as file:
+                    file.write(content)
 
-            zf.writestr('inventory.json', json.dumps(inventory))
+                zf.writestr('data.json', content)
+            self.timer.step('main ship data saved to zip')
+
+            zf.writestr('inventory.json', json.dumps(self.inventory))
 
             self.timer.stop('datafiles saved')
+
+        self.cache.save()
+        self.cache.report(_logger.info)
         self.timer.stop('ALL DONE!')
         
-    def _get_ships(self):
+    def _get_ships(self, zf):
         self.timer.start()
-        ships = self.config.goods.get_by_kv('category', 'ship')
+        ships = self.config.get_by_kv('goods', 'category', 'ship')
 
         result_dict = {
             'ships': {},
         }
 
-        import_id = 0
-        for ship in ships:
-            self.timer.start()
+        jobs = []
+        for import_id, ship in enumerate(ships):
             hull_name = ship.get('hull')
-            hull = self.config.goods.get_by_kv('nickname', hull_name, multiple=False)
+            hull = self.config.get_by_kv('goods', 'nickname', hull_name, multiple=False)
 
             ship_name = hull.get('ship')
+            shiparch_entry = self.config.get_by_kv('shiparch', 'nickname', ship_name, multiple=False)
+
             result_dict['ships'][import_id] = {
                 'price': hull.get('price'),
             }
-            self._get_ship_info(result_dict['ships'][import_id], ship_name)
-            self._get_model(result_dict['ships'][import_id], ship_name, import_id)
+            self._get_ship_info(result_dict['ships'][import_id], shiparch_entry)
+            jobs.append((import_id, ship_name, shiparch_entry, self._get_model_path(ship_name, shiparch_entry)))
+
+        self.timer.step('ship infos parsed')
 
-            self.timer.stop('ship {} parsed'.format(ship_name))
-            import_id += 1
+        # map() keeps the job order, so merging stays identical to a serial run
+        paths = [path for _, _, _, path in jobs]
+        models = self._cached_map(
+            'models', parse_ship_model, [(path, self.lod_budgets) for path in paths], paths,
+            [self.lod_budgets] * len(paths),
+        )
+        for (import_id, ship_name, shiparch_entry, _), parsed in zip(jobs, models):
+            self._get_model(result_dict['ships'][import_id], ship_name, shiparch_entry, import_id, parsed, zf)
+            parsed = None
+            self.timer.step('ship {} parsed'.format(ship_name))
 
-        self.timer.step('all ships parsed')
-        self._get_textures(result_dict)
-        self.timer.stop('textures parsed')
+        self.timer.stop('all ships parsed')
 
         return result_dict
 
-    def _get_ship_info(self, result_dict, ship_name):
-        shiparch_entry = self.config.shiparch.get_by_kv('nickname', ship_name, multiple=False)
+    def _map(self, func, items):
+        """ ordered map over the worker pool, never keeps more than `jobs` results in flight """
+        if self.jobs == 1:
+            for item in items:
+                yield func(item)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= self.jobs:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def _cached_map(self, kind, func, items, paths, extras=None):
+        """ like _map, but results of unchanged files come from the cache and never reach the pool """
+        extras = extras or [None] * len(items)
+        keys = [self.cache.get_key(kind, path, extra) for path, extra in zip(paths, extras)]
+        cached = [self.cache.has(kind, key) for key in keys]
+
+        computed = self._map(func, [item for item, is_cached in zip(items, cached) if not is_cached])
+        for key, is_cached in zip(keys, cached):
+            if is_cached:
+                yield self.cache.load(kind, key)
+            else:
+                result = next(computed)
+                self.cache.store(kind, key, result)
+                yield result
+
+    def _get_ship_info(self, result_dict, shiparch_entry):
         ids_name = shiparch_entry.get('ids_name')
         ids_info = shiparch_entry.get('ids_info')
 
         extended_dict = {            
-            'name': 'unknown' if not ids_name else try_decode(self.config.get_dll_string(ids_name)),
-            'infocard': 'unknown' if not ids_info else try_decode(self.config.get_dll_string(ids_info)),
+            'name': 'unknown' if not ids_name else self.config.get_resource_string(ids_name),
+            'infocard': 'unknown' if not ids_info else self.config.get_resource_string(ids_info),
         }
         for stat in self.STATS_FIELDS:
             stat_content = shiparch_entry.get(stat)
@@ -116,38 +176,31 @@ class ShipDataImporter(object):
 
         result_dict.update(extended_dict)
 
-    def _get_model(self, result_dict, ship_name, import_id):
-        shiparch_entry = self.config.shiparch.get_by_kv('nickname', ship_name, multiple=False)
-
+    def _get_model_path(self, ship_name, shiparch_entry):
         path = self.config.get_absolute_path('data', shiparch_entry.get('DA_archetype'))
         _logger.debug(path)
 
         if not os.path.isfile(path):            
             raise ParserError('could not find cmp for {}'.format(ship_name))
 
-        utf = UTFFile(path)
-        model = CMPModel(utf, self)
+        return path
 
-        model_data = {
-            'lods': model.get_lod_levels(),
-            'vertices': model.prepared_vertices,
-            'normals': model.prepared_normals,
-            'uvs': model.prepared_uvs,
-            'materials_per_mesh': model.materials_per_mesh,
-        }
-        result_dict['model_data'] = {'lods': model.get_lod_levels()}
+    def _get_model(self, result_dict, ship_name, shiparch_entry, import_id, parsed, zf):
+        model_data = parsed['model_data']
+        result_dict['model_data'] = {'lods': model_data['lods']}
 
         self.mat_map[import_id] = {
             'paths': concat_lists(shiparch_entry.get('material_library'), []),
-            'ids': model.material_ids,
+            'ids': parsed['material_ids'],
         }
 
-        self.data_files.append(ModelEncoder(ship_name, import_id, model_data))
-        self._get_hardpoints(result_dict, utf)
-
-    def _get_hardpoints(self, result_dict, model):
-        hp_parser = HardpointParser(model, self)
-        result_dict['hardpoints'] = hp_parser.hardpoints
+        encoder = ModelEncoder(ship_name, import_id, model_data, self.model_format)
+        if self.stream:
+            # write right away, the geometry is dropped with the encoder
+            self.inventory += encoder.write_to_zip(zf)
+        else:
+            self.data_files.append(encoder)
+        result_dict['hardpoints'] = parsed['hardpoints']
 
     def _get_path_map(self):
         path_map = {}
@@ -156,7 +209,7 @@ class ShipDataImporter(object):
 
             if abs_path not in path_map:
                 path_map[abs_path] = {
-                    'file': UTFFile(abs_path),
+                    'source': path.lower().replace('\\', '/'),
                     'ids': self.mat_map[import_id]['ids'],
                     'import_ids': [import_id],
                 }
@@ -171,33 +224,51 @@ class ShipDataImporter(object):
                 yield import_id, path
 
 
-    def _get_textures(self, result_dict):
+    def _get_textures(self, result_dict, zf):
         path_map = self._get_path_map()
+        jobs = [
+            (list(set(path_map[path]['ids'])), path, self.texture_format, self.texture_sizes)
+            for path in path_map
+        ]
+
+        writer = ZipWriterThread(zf, self.jobs)
+        writer.start()
 
         pack_id = 0
         result_dict['texture_ids'] = {}
-        for path in path_map:
-            material_ids = list(set(path_map[path]['ids']))
-
-            full_pack = TexturePack(material_ids, [path_map[path]['file']], self)
-            textures = full_pack.get_textures()
-
-            if not textures:
-                continue
-
-            self.data_files.append(TextureEncoder(pack_id, material_ids, path_map[path]['file'], self))
-
-            for import_id in path_map[path]['import_ids']:
-                if result_dict['ships'][import_id].get('texture_pack_ids') is None:
-                    result_dict['ships'][import_id]['texture_pack_ids'] = []
-                result_dict['ships'][import_id]['texture_pack_ids'].append(pack_id)
-
-            result_dict['texture_ids'][pack_id] = list(textures.keys())
-
-            full_pack = None
-            textures = None
-
-            pack_id += 1
+        result_dict['texture_sources'] = {}
+        result_dict['texture_formats'] = {}
+        result_dict['texture_sizes'] = self.texture_sizes
+        try:
+            packs = self._cached_map('textures', encode_texture_pack, jobs, [path for _, path, _, _ in jobs], [
+                [sorted(material_ids), texture_format, sizes] for material_ids, _, texture_format, sizes in jobs
+            ])
+            for (_, path, _, _), (texture_ids, entries) in zip(jobs, packs):
+                if not texture_ids:
+                    continue
+
+                # entries are handed over one by one and dropped here, so a written texture is freed right away
+                formats = {}
+                for index, (name, content) in enumerate(entries):
+                    entries[index] = None
+                    if name.count('.') == 1:
+                        formats[name[:-len('.tex')]] = get_texture_format(content)
+                    writer.put([('{}.{}'.format(pack_id, name), content)])
+                content = None
+
+                for import_id in path_map[path]['import_ids']:
+                    if result_dict['ships'][import_id].get('texture_pack_ids') is None:
+                        result_dict['ships'][import_id]['texture_pack_ids'] = []
+                    result_dict['ships'][import_id]['texture_pack_ids'].append(pack_id)
+
+                result_dict['texture_ids'][pack_id] = texture_ids
+                result_dict['texture_sources'][pack_id] = path_map[path]['source']
+                result_dict['texture_formats'][pack_id] = formats
+                pack_id += 1
+        finally:
+            inventory = writer.close()
+
+        return inventory
 
     def status(self, message):
         _logger.info(message)
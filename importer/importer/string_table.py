@@ -0,0 +1,104 @@
+"""
+compact lookup file for resource strings, keyed by the global ids number.
+
+layout (little endian):
+    header  magic 'FLST', uint32 version, uint32 slot count, uint32 string count, 20 byte fingerprint
+    slots   slot count * (uint32 ids, uint32 offset, uint32 length), open addressing, ids 0 marks a free slot
+    blob    utf-8 encoded strings, offsets are relative to the blob start
+
+the reader only needs the standard library, lookups are O(1) on the mmapped file.
+"""
+import os
+import mmap
+import struct
+
+MAGIC = b'FLST'
+VERSION = 1
+
+HEADER = struct.Struct('<4sIII20s')
+SLOT = struct.Struct('<III')
+
+
+def _slot_index(ids, mask):
+    return ((ids * 2654435761) & 0xFFFFFFFF) & mask
+
+
+def write_string_table(path, strings, fingerprint):
+    """ writes {ids: str} to path, fingerprint is 20 bytes identifying the source DLLs """
+    slot_count = 1
+    while slot_count < len(strings) * 2:
+        slot_count *= 2
+
+    mask = slot_count - 1
+    slots = [(0, 0, 0)] * slot_count
+    blob = bytearray()
+
+    for ids in sorted(strings):
+        content = strings[ids].encode('utf-8')
+
+        index = _slot_index(ids, mask)
+        while slots[index][0] != 0:
+            index = (index + 1) & mask
+
+        slots[index] = (ids, len(blob), len(content))
+        blob += content
+
+    with open(path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, slot_count, len(strings), fingerprint))
+        for slot in slots:
+            file.write(SLOT.pack(*slot))
+        file.write(blob)
+
+    # replace in one step, readers never see a half written table
+    os.replace(path + '.tmp', path)
+
+
+class StringTable(object):
+    def __init__(self, path):
+        if os.path.getsize(path) < HEADER.size:
+            raise ValueError('{} is truncated'.format(path))
+
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._slot_count, self.count, self.fingerprint = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a string table (version {})'.format(path, VERSION))
+
+        self._mask = self._slot_count - 1
+        self._blob_offset = HEADER.size + self._slot_count * SLOT.size
+        if len(self._map) < self._blob_offset:
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+
+    def get(self, ids, default=None):
+        ids = int(ids)
+        if ids == 0:
+            return default
+
+        index = _slot_index(ids, self._mask)
+        for _ in range(self._slot_count):
+            slot_ids, offset, length = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+
+            if slot_ids == ids:
+                start = self._blob_offset + offset
+                return self._map[start:start + length].decode('utf-8')
+            if slot_ids == 0:
+                return default
+
+            index = (index + 1) & self._mask
+        return default
+
+    def items(self):
+        for index in range(self._slot_count):
+            slot_ids, offset, length = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+            if slot_ids != 0:
+                start = self._blob_offset + offset
+                yield slot_ids, self._map[start:start + length].decode('utf-8')
+
+    def __contains__(self, ids):
+        return self.get(ids) is not None
+
+    def close(self):
+        self._map.close()
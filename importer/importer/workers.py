@@ -0,0 +1,59 @@
+import logging
+
+from .pyfl_utils import UTFFile
+from .pyfl_utils.models.cmpmodel import CMPModel
+
+from .hardpoint_parser import HardpointParser
+from .data_encoder import TextureEncoder
+from .decimator import generate_lods
+
+_logger = logging.getLogger(__name__)
+
+
+class WorkerStatus(object):
+    """ stands in for the ShipDataImporter as parser parent inside pool workers """
+
+    def status(self, message):
+        _logger.info(message)
+
+
+def parse_ship_model(job):
+    """
+    parses model and hardpoints of a single CMP and adds the decimated LODs,
+    must stay picklable for the process pool. job is (path, lod_budgets)
+    """
+    path, lod_budgets = job
+    parent = WorkerStatus()
+
+    utf = UTFFile(path)
+    model = CMPModel(utf, parent)
+    hp_parser = HardpointParser(utf, parent)
+
+    model_data = {
+        'lods': model.get_lod_levels(),
+        'vertices': model.prepared_vertices,
+        'normals': model.prepared_normals,
+        'uvs': model.prepared_uvs,
+        'materials_per_mesh': model.materials_per_mesh,
+    }
+
+    generated = generate_lods(model_data, lod_budgets)
+    if generated:
+        _logger.debug('{}: generated {}'.format(path, ', '.join(generated)))
+
+    return {
+        'model_data': model_data,
+        'material_ids': model.material_ids,
+        'hardpoints': hp_parser.hardpoints,
+    }
+
+
+def encode_texture_pack(job):
+    """
+    decodes and encodes all textures of one material library,
+    job is (material_ids, path, texture_format, sizes)
+    """
+    material_ids, path, texture_format, sizes = job
+
+    encoder = TextureEncoder(material_ids, UTFFile(path), WorkerStatus(), texture_format, sizes)
+    return encoder.encode()
@@ -0,0 +1,43 @@
+import threading
+
+from queue import Queue
+
+
+class ZipWriterThread(threading.Thread):
+    """ single consumer that owns all writes to the output zip while producers keep encoding """
+
+    def __init__(self, zf, max_pending):
+        super(ZipWriterThread, self).__init__(name='zip-writer')
+        self.zf = zf
+        self.queue = Queue(maxsize=max_pending)
+        self.inventory = []
+        self.error = None
+
+    def put(self, entries):
+        """ queues a list of (filename, content) tuples, blocks while max_pending lists are waiting """
+        self.queue.put(entries)
+
+    def run(self):
+        while True:
+            entries = self.queue.get()
+            if entries is None:
+                return
+
+            # keep draining after an error so producers never block on a full queue
+            if self.error is not None:
+                continue
+
+            try:
+                for filename, content in entries:
+                    self.zf.writestr(filename, content)
+                    self.inventory.append(filename)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+        if self.error is not None:
+            raise self.error
+        return self.inventory
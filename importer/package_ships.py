@@ -1,6 +1,7 @@
 import argparse
 import logging
 
+from importer.data_encoder import ModelEncoder, TextureEncoder
 from importer.importer import ShipDataImporter
 
 _logger = logging.getLogger('main')
@@ -29,6 +30,69 @@ def get_args():
         help="root directory of installation"
     )
 
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='number of worker processes used to parse ship models'
+    )
+
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        default=False,
+        help='write each ship to the zip as soon as it is parsed (no debug.json)'
+    )
+
+    parser.add_argument(
+        '--model-format',
+        choices=ModelEncoder.FORMATS,
+        default='mesh',
+        help='mesh: indexed with welded vertices, quantized: mesh with 16 bit attributes, legacy: one float list per attribute'
+    )
+
+    parser.add_argument(
+        '--texture-format',
+        choices=TextureEncoder.FORMATS,
+        default='dxt',
+        help='dxt: DXT1/DXT5 blocks where the texture size allows it, rgba: uncompressed'
+    )
+
+    parser.add_argument(
+        '--texture-sizes',
+        type=str,
+        default='256,512,1024',
+        help='comma separated longest sides of the size capped texture variants'
+    )
+
+    parser.add_argument(
+        '--lod-budgets',
+        type=str,
+        default='4000,1000',
+        help='comma separated triangle budgets of generated LODs, for ships whose lightest LOD is above them'
+    )
+
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default='.import_cache',
+        help='directory of the parsed model and texture cache'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        default=False,
+        help='parse everything, neither read nor write the cache'
+    )
+
+    parser.add_argument(
+        '--rebuild-cache',
+        action='store_true',
+        default=False,
+        help='ignore cached entries and replace them with fresh ones'
+    )
+
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -0,0 +1,63 @@
+import unittest
+
+from io import BytesIO
+from zipfile import ZipFile
+
+import numpy as np
+
+from importer.data_encoder import (
+    MESH_ENTRY, MESH_HEADER, MESH_QUANTIZATION, VERTEX_COMPONENTS, ModelEncoder, quantize_attributes,
+)
+from importer.decimator import generate_lods
+
+
+def build_model(meshes):
+    """ model data of a single LOD, meshes is a list of (vertices, normals, uvs) """
+    return {
+        'lods': ['Level0'],
+        'vertices': {'Level0': [vertices for vertices, _, _ in meshes]},
+        'normals': {'Level0': [normals for _, normals, _ in meshes]},
+        'uvs': {'Level0': [uvs for _, _, uvs in meshes]},
+        'materials_per_mesh': {'Level0': list(range(len(meshes)))},
+    }
+
+
+class QuantizedMeshTest(unittest.TestCase):
+    def test_empty_attributes(self):
+        rows, quantization, errors = quantize_attributes(np.empty((0, VERTEX_COMPONENTS), dtype='<f4'))
+
+        self.assertEqual(rows.shape, (0, 7))
+        self.assertEqual(quantization, (0.0, 0.0, 0.0, 1.0, 1.0, 1.0))
+        self.assertEqual(errors, (0.0, 0.0, 0.0))
+
+    def test_empty_mesh(self):
+        triangle = ([0, 0, 0, 1, 0, 0, 0, 1, 0], [[0, 0, 1]] * 3, [0, 0, 1, 0, 0, 1])
+        buffer = BytesIO()
+        with ZipFile(buffer, mode='w') as zf:
+            ModelEncoder('test', 0, build_model([([], [], []), triangle]), model_format='quantized').write_to_zip(zf)
+
+        with ZipFile(buffer) as zf:
+            content = zf.read('0.mesh.level0.dat')
+
+        self.assertEqual(MESH_HEADER.unpack_from(content)[3], 2)
+        entry_size = MESH_ENTRY.size + MESH_QUANTIZATION.size
+        vertex_counts = [
+            MESH_ENTRY.unpack_from(content, MESH_HEADER.size + index * entry_size)[1] for index in range(2)
+        ]
+        self.assertEqual(vertex_counts, [0, 3])
+
+
+class GeneratedLodTest(unittest.TestCase):
+    def test_names_do_not_collide_with_lowercase_lods(self):
+        positions = np.random.RandomState(0).rand(300 * 9).tolist()
+        mesh = (positions, [[0, 0, 1]] * 900, [0] * 1800)
+        model_data = build_model([mesh])
+        for key in ['vertices', 'normals', 'uvs', 'materials_per_mesh']:
+            model_data[key]['level2'] = model_data[key]['Level0']
+        model_data['lods'].append('level2')
+
+        self.assertEqual(generate_lods(model_data, [100]), ['Level3'])
+
+
+if __name__ == '__main__':
+    unittest.main()